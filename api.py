@@ -1,6 +1,24 @@
-from fastapi import FastAPI, APIRouter, HTTPException
-from pydantic import BaseModel
-from src.rag_sql import RAGSQL
+from fastapi import FastAPI, APIRouter, Header, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import Optional
+from contextlib import ExitStack, contextmanager
+from urllib.parse import quote
+import asyncio
+import json
+import os
+import time
+from src.embeddings import load_embedder
+from src.jobs import DONE, EXPIRED, FINAL_STATES, JobManager
+from src.metrics import metrics
+from src.model import SQLCoderAgent
+from src.query_log import QueryLog, current_trace
+from src.readiness import Readiness
+from src.result_formats import COLUMNAR_JSON, ENCODERS, JSON, negotiate
+from src.scheduler import GenerationScheduler, GenerationSlots, Overloaded, RequestContext, load_scheduler_config, request_context
+from src.tenants import TenantManager, UnknownTenantError, load_tenants
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -8,74 +26,359 @@ logger = logging.getLogger(__name__)
 
 class QueryRequest(BaseModel):
     query: str
+    tenant: str = "default"
 
 class SQLResponse(BaseModel):
     query: str
     generated_sql: str
+    prompt_tokens: Optional[int] = None
 
 class ExecuteRequest(BaseModel):
     query: str
+    tenant: str = "default"
+    category: Optional[str] = None
+    limit: int = Field(3, ge=1, le=1_000_000)
+    approximate: bool = False
 
 class ExecuteResponse(BaseModel):
     query: str
     generated_sql: str
     result: dict
+    attempts: int = 1
+    prompt_tokens: Optional[int] = None
+    approximation: Optional[dict] = None
+
+class JobRequest(BaseModel):
+    query: str
+    tenant: str = "default"
+
+class JobStatus(BaseModel):
+    job_id: str
+    tenant: str
+    query: str
+    status: str
+    generated_sql: Optional[str] = None
+    error: Optional[str] = None
+    row_count: Optional[int] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+DEFAULT_REQUEST_TIMEOUT_S = 90.0
+MAX_REQUEST_TIMEOUT_S = 600.0
 
 class SQLRAGService(APIRouter):
     def __init__(self):
         super().__init__()
-        self.rag_agent = RAGSQL()
+        # admission control in front of Ollama, shared by all tenants; limits from data/scheduler.json.
+        # The permits are shared with the job workers, so max_concurrent covers their generations too.
+        config = load_scheduler_config()
+        generation_slots = GenerationSlots(config.max_concurrent)
+        self.scheduler = GenerationScheduler(max_concurrent=config.max_concurrent, max_queue=config.max_queue,
+                                             max_queue_per_client=config.max_queue_per_client,
+                                             initial_estimate_s=config.initial_estimate_s,
+                                             slots=generation_slots)
+
+        # one embedding model shared by all tenants; per-tenant index and pool
+        self.tenants = TenantManager(
+            load_tenants(),
+            embedder=load_embedder(),
+            sql_agent=SQLCoderAgent(scheduler=self.scheduler),
+            max_loaded=4,
+            idle_ttl_s=900.0,
+            rag_kwargs={"max_repairs": 2, "repair_budget_s": 60.0},
+        )
+        self.tenants.preload(["default"])
+
+        # long-running queries: SQLite queue + worker processes, results spilled to disk
+        self.jobs = JobManager(num_workers=2, rag_kwargs={"max_repairs": 0},
+                               generation_slots=generation_slots, job_deadline_s=config.job_deadline_s)
+        self.add_event_handler("startup", self.jobs.start)
+        self.add_event_handler("shutdown", self.jobs.stop)
+
+        # structured per-request log (question, tables, SQL, timings), written off the request path
+        self.query_log = QueryLog('logs/queries.jsonl')
+        self.add_event_handler("startup", self.query_log.start)
+        self.add_event_handler("shutdown", self.query_log.stop)
+
+        # warmup in the background; /ready reports 503 until every step succeeded,
+        # and again while the model is reloaded after Ollama unloaded it
+        self.readiness = Readiness({
+            "ollama": self.tenants.sql_agent.warmup,
+            "retrieval": lambda: self._warm_tenant("default", lambda rag: rag.warmup_retrieval()),
+            "database": lambda: self._warm_tenant("default", lambda rag: {"connections": rag.warmup_pool()}),
+        }, checks={"ollama": self.tenants.sql_agent.check_loaded})
+        self.add_event_handler("startup", self.readiness.start)
+        self.add_event_handler("shutdown", self.readiness.stop)
 
         self.add_api_route("/generate-sql", self.generate_sql_endpoint, methods=["POST"], response_model=SQLResponse)
         self.add_api_route("/execute-sql", self.execute_sql_endpoint, methods=["POST"], response_model=ExecuteResponse)
+        self.add_api_route("/jobs", self.submit_job_endpoint, methods=["POST"], response_model=JobStatus)
+        self.add_api_route("/jobs/{job_id}", self.job_status_endpoint, methods=["GET"], response_model=JobStatus)
+        self.add_api_route("/jobs/{job_id}/events", self.job_events_endpoint, methods=["GET"])
+        self.add_api_route("/jobs/{job_id}/result", self.job_result_endpoint, methods=["GET"])
+        self.add_api_route("/jobs/{job_id}/cancel", self.cancel_job_endpoint, methods=["POST"], response_model=JobStatus)
+        self.add_api_route("/metrics", self.metrics_endpoint, methods=["GET"])
+        self.add_api_route("/ready", self.ready_endpoint, methods=["GET"])
         self.add_api_route("/", self.root_endpoint, methods=["GET"])
 
-    async def generate_sql_endpoint(self, request: QueryRequest):
+    def _warm_tenant(self, tenant: str, fn):
+        with self.tenants.acquire(tenant) as rag_agent:
+            return fn(rag_agent)
+
+    @staticmethod
+    def _request_context(http_request: Request, client_id: Optional[str], timeout: Optional[float]) -> RequestContext:
+        """Client from X-Client-Id (else the peer address); deadline from X-Request-Timeout seconds."""
+        if not client_id:
+            client_id = http_request.client.host if http_request.client else "anonymous"
+        timeout = min(timeout or DEFAULT_REQUEST_TIMEOUT_S, MAX_REQUEST_TIMEOUT_S)
+        return RequestContext(client_id=client_id, deadline=time.monotonic() + timeout)
+
+    @staticmethod
+    async def _run(ctx: RequestContext, trace: dict, fn, *args, **kwargs):
+        """Run blocking work in the threadpool under the request's scheduling context and trace."""
+        def call():
+            ctx_token = request_context.set(ctx)
+            trace_token = current_trace.set(trace)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                current_trace.reset(trace_token)
+                request_context.reset(ctx_token)
+        return await run_in_threadpool(call)
+
+    @staticmethod
+    def _new_trace(endpoint: str, request: BaseModel, ctx: RequestContext, **params) -> dict:
+        """Query log entry; 'request' holds what a replay needs besides the question."""
+        return {
+            "ts": time.time(),
+            "endpoint": endpoint,
+            "client_id": ctx.client_id,
+            "question": request.query,
+            "request": {**request.model_dump(exclude={"query"}), **params},
+            "timings": {},
+            "_start": time.perf_counter(),
+        }
+
+    def _log(self, trace: dict, status: int, **fields):
+        trace.update(fields)
+        trace["status"] = status
+        trace["timings"]["total_s"] = round(time.perf_counter() - trace.pop("_start"), 4)
+        self.query_log.record(trace)
+
+    @contextmanager
+    def _traced(self, trace: dict):
+        """Log the request if the block fails; success is logged by the endpoint."""
+        try:
+            yield
+        except HTTPException as e:
+            self._log(trace, e.status_code, error=str(e.detail))
+            raise
+        except Overloaded as e:
+            self._log(trace, e.status_code, error=str(e))
+            raise
+
+    async def generate_sql_endpoint(self, request: QueryRequest, http_request: Request,
+                                    x_client_id: Optional[str] = Header(None),
+                                    x_request_timeout: Optional[float] = Header(None)):
         """
         Generate SQL query from natural language query using RAG.
         """
-        try:
-            logger.info(f"Received query: {request.query}")
-            sql = self.generate_sql(request.query)
-            logger.info(f"Generated SQL: {sql}")
-            return SQLResponse(query=request.query, generated_sql=sql)
-        except Exception as e:
-            logger.error(f"Error generating SQL: {e}")
-            raise HTTPException(status_code=500, detail=f"Error generating SQL: {str(e)}")
+        ctx = self._request_context(http_request, x_client_id, x_request_timeout)
+        trace = self._new_trace("/generate-sql", request, ctx)
+        with self._traced(trace):
+            try:
+                logger.info(f"Received query: {request.query}")
+                result = await self._run(ctx, trace, self.generate_sql, request.query, request.tenant)
+                sql = result.get("processed", "")
+                logger.info(f"Generated SQL: {sql}")
+            except UnknownTenantError:
+                raise HTTPException(status_code=404, detail=f"Unknown tenant: {request.tenant}")
+            except Overloaded:
+                raise
+            except Exception as e:
+                logger.error(f"Error generating SQL: {e}")
+                raise HTTPException(status_code=500, detail=f"Error generating SQL: {str(e)}")
 
-    async def execute_sql_endpoint(self, request: ExecuteRequest):
+        self._log(trace, 200, generated_sql=sql, prompt_tokens=result.get("prompt_tokens"))
+        return SQLResponse(query=request.query, generated_sql=sql, prompt_tokens=result.get("prompt_tokens"))
+
+    async def execute_sql_endpoint(self, request: ExecuteRequest, http_request: Request,
+                                   format: Optional[str] = None,
+                                   accept: Optional[str] = Header(None),
+                                   x_client_id: Optional[str] = Header(None),
+                                   x_request_timeout: Optional[float] = Header(None)):
         """
-        Generate SQL from query and execute it, returning results (limited to 3 rows for safety).
-        Only SELECT queries are allowed.
+        Generate SQL from query and execute it, returning results (limited to 3 rows by default).
+        Only SELECT queries are allowed. Failing SQL is repaired using the DB error feedback.
+        Output format is negotiated from ?format= (json, columnar, csv, arrow, parquet) or the
+        Accept header and streamed from the DB cursor in batches.
+        With "approximate": true, large tables are scanned as a TABLESAMPLE and counts/sums
+        are scaled; the sample is described in "approximation" / the X-Approximate header.
         """
         try:
-            logger.info(f"Received query for execution: {request.query}")
+            media_type = negotiate(accept, format)
+        except ValueError as e:
+            raise HTTPException(status_code=406, detail=str(e))
+
+        ctx = self._request_context(http_request, x_client_id, x_request_timeout)
+        trace = self._new_trace("/execute-sql", request, ctx, accept=media_type)
+        stack = ExitStack()
+
+        def run():
+            rag_agent = stack.enter_context(self.tenants.acquire(request.tenant))
+            return rag_agent.generate_and_execute(request.query, limit=request.limit,
+                                                  category=request.category, stream=True,
+                                                  approximate=request.approximate)
+
+        with self._traced(trace):
+            try:
+                logger.info(f"Received query for execution: {request.query}")
+                outcome = await self._run(ctx, trace, run)
+                sql, attempts = outcome["sql"], outcome["attempts"]
+                logger.info(f"Generated SQL: {sql} (attempts: {attempts})")
+            except UnknownTenantError:
+                stack.close()
+                raise HTTPException(status_code=404, detail=f"Unknown tenant: {request.tenant}")
+            except Overloaded:
+                stack.close()
+                raise
+            except Exception as e:
+                stack.close()
+                logger.error(f"Error: {e}")
+                raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+        trace.update(generated_sql=sql, attempts=attempts, prompt_tokens=outcome.get("prompt_tokens"),
+                     approximate=bool(outcome.get("approximation")), row_count=0)
+
+        meta = {}
+        if media_type in (JSON, COLUMNAR_JSON):
+            meta = {"query": request.query, "generated_sql": sql, "attempts": attempts,
+                    "prompt_tokens": outcome.get("prompt_tokens")}
+            if outcome.get("approximation"):
+                meta["approximation"] = outcome["approximation"]
 
-            sql = self.generate_sql(request.query)
-            logger.info(f"Generated SQL: {sql}")
+        def counted(batches):
+            for columns, rows in batches:
+                trace["row_count"] += len(rows)
+                yield columns, rows
 
-            result = self.execute_sql(sql, limit=3)
-            logger.info(f"Execution result: {len(result.get('rows', []))} rows")
+        def finish(error: str = None):
+            stack.close()
+            if "status" not in trace:  # once: end of body, or the background task if it never ran
+                self._log(trace, 200, error=error)
 
-            return ExecuteResponse(query=request.query, generated_sql=sql, result=result)
-        except Exception as e:
-            logger.error(f"Error: {e}")
-            raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+        def body():
+            # the tenant stays checked out until the last batch is sent
+            error = None
+            try:
+                with stack:
+                    yield from ENCODERS[media_type](counted(outcome["result"]), meta)
+            except Exception as e:
+                error = str(e)
+                raise
+            finally:
+                finish(error)
+
+        headers = {"X-Generated-SQL": quote(sql, safe=" (),*=<>'."), "X-Attempts": str(attempts),
+                   "X-Prompt-Tokens": str(outcome.get("prompt_tokens") or 0)}
+        if outcome.get("approximation"):
+            approx = outcome["approximation"]
+            headers["X-Approximate"] = (f"table={approx['sampled_table']}; sample_percent={approx['sample_percent']:g}; "
+                                        f"method={approx.get('method', 'SYSTEM')}; scale={approx['scale']:g}; "
+                                        f"error_columns={str(approx['error_columns']).lower()}")
+        # background close also covers clients that disconnect before the body starts
+        return StreamingResponse(body(), media_type=media_type, headers=headers,
+                                 background=BackgroundTask(finish))
+
+    def _get_job(self, job_id: str) -> dict:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+        return job
+
+    # the job endpoints are plain functions: SQLite and pg_cancel_backend calls block,
+    # so FastAPI runs them in its threadpool instead of on the event loop
+    def submit_job_endpoint(self, request: JobRequest):
+        """
+        Queue a question for background generation + execution. Poll /jobs/{job_id}.
+        """
+        if request.tenant not in self.tenants.tenants:
+            raise HTTPException(status_code=404, detail=f"Unknown tenant: {request.tenant}")
+        job_id = self.jobs.submit(request.query, request.tenant)
+        logger.info(f"Queued job {job_id}: {request.query}")
+        return JobStatus(**self.jobs.get(job_id))
+
+    def job_status_endpoint(self, job_id: str):
+        return JobStatus(**self._get_job(job_id))
+
+    async def job_events_endpoint(self, job_id: str):
+        """
+        Server-sent events with the job status on every change, until it finishes.
+        """
+        await run_in_threadpool(self._get_job, job_id)
+
+        async def events():
+            last = None
+            while True:
+                job = JobStatus(**await run_in_threadpool(self.jobs.get, job_id)).model_dump()
+                if job != last:
+                    yield f"data: {json.dumps(job)}\n\n"
+                    last = job
+                if job["status"] in FINAL_STATES:
+                    return
+                await asyncio.sleep(0.5)
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    def job_result_endpoint(self, job_id: str):
+        """
+        Full result as NDJSON (first line: columns), sent gzip-encoded as stored.
+        """
+        job = self._get_job(job_id)
+        if job["status"] == EXPIRED or (job["status"] == DONE and not os.path.exists(job["result_path"] or "")):
+            raise HTTPException(status_code=410, detail="Job result has expired")
+        if job["status"] != DONE:
+            raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+        return FileResponse(job["result_path"], media_type="application/x-ndjson",
+                            headers={"Content-Encoding": "gzip"})
+
+    def cancel_job_endpoint(self, job_id: str):
+        self._get_job(job_id)
+        return JobStatus(**self.jobs.cancel(job_id, self.tenants))
+
+    async def metrics_endpoint(self):
+        """
+        In-process metrics (repair attempts per category, queue depth and wait, etc.).
+        """
+        return {**metrics.snapshot(), "tenants": self.tenants.status(),
+                "scheduler": {**self.scheduler.status(), "permit_holders": self.scheduler.slots.holders()}}
 
     async def root_endpoint(self):
         """
-        Health check endpoint.
+        Liveness check endpoint (the process is up); see /ready for readiness.
         """
         return {"message": "SQL RAG API is running", "status": "healthy"}
 
-    def generate_sql(self, query: str) -> str:
-        result = self.rag_agent.generate_sql(query)
+    async def ready_endpoint(self):
+        """
+        Readiness probe: 200 once the model is loaded in Ollama, the embedder and
+        index are warm and pool connections are open; 503 before that.
+        Per-component status and warmup timings in the body.
+        """
+        status = self.readiness.status()
+        return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+    def generate_sql(self, query: str, tenant: str = "default") -> dict:
+        """Model response: processed SQL plus prompt token usage."""
+        with self.tenants.acquire(tenant) as rag_agent:
+            result = rag_agent.generate_sql(query)
         if isinstance(result, dict):
-            return result.get("processed", "")
-        return result
+            return result
+        return {"processed": result}
 
-    def execute_sql(self, sql: str, limit: int = 3):
-        return self.rag_agent.execute_sql(sql, limit)
+    def execute_sql(self, sql: str, limit: int = 3, tenant: str = "default"):
+        with self.tenants.acquire(tenant) as rag_agent:
+            return rag_agent.execute_sql(sql, limit)
 
 app = FastAPI(
     title="SQL RAG API",
@@ -83,6 +386,13 @@ app = FastAPI(
     version="1.0.0"
 )
 
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Fast rejection from admission control, with a retry hint."""
+    return JSONResponse(status_code=exc.status_code,
+                        content={"detail": str(exc), "reason": exc.reason},
+                        headers={"Retry-After": str(exc.retry_after)})
+
 service = SQLRAGService()
 app.include_router(service)
 
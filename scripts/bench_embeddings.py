@@ -0,0 +1,103 @@
+"""
+Embedding backend benchmark: SentenceTransformer (torch) vs int8 ONNX.
+
+Each backend runs in its own subprocess so peak RSS is comparable. Reports
+load time, peak RSS, single-query encode latency (uncached and via the LRU
+cache), and retrieval agreement: overlap of the top-k tables returned by
+SchemaIndex over data/db.json for every question in test_queries.json.
+
+Usage: python -m scripts.bench_embeddings --threads 1 --top-k 5
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+QUERIES_FILE = "test_queries.json"
+SCHEMA_FILE = "data/db.json"
+
+
+def load_queries() -> list:
+    with open(QUERIES_FILE) as f:
+        data = json.load(f)
+    return [q["query"] for cat in data["test_queries"] for q in cat["queries"]]
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def run_backend(args) -> dict:
+    from src.embeddings import load_embedder
+    from src.schema_index import SchemaIndex
+
+    start = time.perf_counter()
+    embedder = load_embedder(args.backend, onnx_model_dir=args.onnx_model_dir, num_threads=args.threads)
+    load_s = time.perf_counter() - start
+
+    with open(SCHEMA_FILE) as f:
+        schema = json.load(f)
+    index = SchemaIndex(schema, encode=embedder.encode)
+    queries = load_queries()
+
+    uncached, cached, top = [], [], {}
+    for _ in range(args.repeat):
+        for q in queries:
+            t0 = time.perf_counter()
+            embedder.backend.encode([q])
+            uncached.append((time.perf_counter() - t0) * 1000)
+    for q in queries:
+        emb = embedder.encode_query(q)
+        t0 = time.perf_counter()
+        embedder.encode_query(q)
+        cached.append((time.perf_counter() - t0) * 1000)
+        top[q] = [table for table, _ in index.search(q, top_k=args.top_k, query_embedding=emb)]
+
+    return {
+        "load_s": load_s,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "p50_ms": percentile(uncached, 50),
+        "p95_ms": percentile(uncached, 95),
+        "cached_p50_ms": percentile(cached, 50),
+        "top": top,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    parser.add_argument("--onnx-model-dir", default="models/all-MiniLM-L6-v2-int8")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args)))
+        return
+
+    results = {}
+    for backend in ["sentence-transformers", "onnx"]:
+        cmd = [sys.executable, "-m", "scripts.bench_embeddings", "--backend", backend,
+               "--onnx-model-dir", args.onnx_model_dir, "--threads", str(args.threads),
+               "--top-k", str(args.top_k), "--repeat", str(args.repeat)]
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+        results[backend] = json.loads(out.strip().splitlines()[-1])
+
+    print(f"{'backend':>22} {'load_s':>7} {'rss_mb':>7} {'p50_ms':>7} {'p95_ms':>7} {'cached_ms':>9}")
+    for backend, r in results.items():
+        print(f"{backend:>22} {r['load_s']:>7.2f} {r['rss_mb']:>7.0f} {r['p50_ms']:>7.2f} "
+              f"{r['p95_ms']:>7.2f} {r['cached_p50_ms']:>9.4f}")
+
+    base, onnx = results["sentence-transformers"]["top"], results["onnx"]["top"]
+    overlap = [len(set(base[q]) & set(onnx[q])) / len(base[q]) for q in base if base[q]]
+    exact = sum(base[q] == onnx[q] for q in base) / len(base)
+    print(f"\nretrieval agreement: top-{args.top_k} overlap {sum(overlap) / len(overlap):.3f}, "
+          f"identical ranking {exact:.3f} over {len(base)} questions")
+
+
+if __name__ == "__main__":
+    main()
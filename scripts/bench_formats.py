@@ -0,0 +1,77 @@
+"""
+Serialization benchmark for /execute-sql result formats.
+
+Rows mimic leaderboard_row (ints, DECIMAL(20,10) score, timestamp) and arrive
+as driver tuples in cursor-sized batches. "baseline" is the previous path:
+per-row lists in a dict, validated by the Pydantic response model and encoded
+by FastAPI (jsonable_encoder + json.dumps). The others are the streaming
+encoders from src/result_formats.py. No database is needed.
+
+Usage: python -m scripts.bench_formats --sizes 10000 100000 1000000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from src.result_formats import ENCODERS
+
+COLUMNS = ["row_id", "participation_id", "best_evaluation_id", "score", "rank", "updated_at"]
+
+
+class ExecuteResponse(BaseModel):
+    query: str
+    generated_sql: str
+    result: dict
+
+
+def make_rows(n: int) -> list:
+    rnd = random.Random(0)
+    start = datetime(2024, 1, 1)
+    return [
+        (i, rnd.randint(1, 5000), rnd.randint(1, 20000),
+         Decimal(f"{rnd.random():.10f}"), rnd.randint(1, 50),
+         start + timedelta(seconds=rnd.randint(0, 10**7)))
+        for i in range(n)
+    ]
+
+
+def batches(rows: list, batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        yield COLUMNS, rows[start:start + batch_size]
+
+
+def baseline(rows: list) -> bytes:
+    result = {"columns": COLUMNS, "rows": [list(row) for row in rows]}
+    response = ExecuteResponse(query="q", generated_sql="SELECT ...", result=result)
+    return json.dumps(jsonable_encoder(response)).encode('utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    meta = {"query": "q", "generated_sql": "SELECT ...", "attempts": 1}
+    print(f"{'rows':>9} {'format':>38} {'seconds':>8} {'rows/s':>12} {'size_mb':>8}")
+    for n in args.sizes:
+        rows = make_rows(n)
+        cases = {"baseline (pydantic + jsonable_encoder)": lambda: baseline(rows)}
+        for media_type, encoder in ENCODERS.items():
+            cases[media_type] = lambda enc=encoder: b''.join(enc(batches(rows, args.batch_size), meta))
+
+        for name, fn in cases.items():
+            start = time.perf_counter()
+            out = fn()
+            elapsed = time.perf_counter() - start
+            print(f"{n:>9} {name:>38} {elapsed:>8.3f} {n / elapsed:>12,.0f} {len(out) / 2**20:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Check and benchmark the post-processing of model output (src/sql_postprocess.py).
+
+Corpus check: every model output in data/model_outputs.jsonl ({"raw",
+"expected", "note"} per line) must post-process to its expected SQL with the
+schema in data/db.json. The corpus started as hand-written cases modelled on
+typical sqlcoder responses; --seed appends the raw responses recorded in the
+query log (raw_response, with the generated_sql that was used as expected),
+so review the new lines before committing them. With --query-log, the logged
+generated_sql (already post-processed) must come out unchanged, and logged raw
+responses must still give their logged SQL. Exits with 1 on any mismatch. The previous inline implementation (regexes compiled per call,
+text-level table renames) is run over the corpus as well, for comparison.
+
+Micro-benchmark: per-call time of both implementations over the corpus.
+
+Usage: python -m scripts.bench_postprocess --repeat 2000 --query-log 'logs/queries.jsonl*'
+       python -m scripts.bench_postprocess --query-log 'logs/queries.jsonl*' --seed
+"""
+import argparse
+import glob
+import json
+import re
+import statistics
+import sys
+import time
+
+from src.sql_postprocess import SQLPostProcessor
+
+
+def legacy_postprocess(text: str) -> str:
+    """The extraction/fixup stage as it was inlined in SQLCoderAgent._generate."""
+    sql_match = re.search(r'```sql\s*([^`]+)\s*```', text, re.IGNORECASE | re.DOTALL)
+    if sql_match:
+        text = sql_match.group(1)
+    else:
+        text = text.replace("<s>", "").replace("</s>", "").replace("[SQL]", "")
+        for delimiter in ["[QUESTION]", "[/QUESTION]", "###", "[/SQL]", "## Response", "```"]:
+            if delimiter in text:
+                text = text.split(delimiter)[0]
+    text = text.strip()
+    text = re.sub(r';(\s*\n){2,}.*$', ';', text, flags=re.DOTALL)
+    table_fixes = {
+        r'\bcompetitions\b': 'competition',
+        r'\bevaluations\b': 'evaluation',
+        r'\bsubmissions\b': 'submission',
+        r'\bparticipations\b': 'participation',
+        r'\bdatasets\b': 'dataset',
+        r'\busers\b': '"user"',
+    }
+    for pattern, replacement in table_fixes.items():
+        text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
+    return ' '.join(text.split()).strip()
+
+
+def load_corpus(path: str) -> list:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_logged(patterns: list) -> list:
+    """Query log records with a generated_sql, oldest file first."""
+    records = []
+    for path in sorted({p for pattern in patterns for p in glob.glob(pattern)}):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if record.get("generated_sql"):
+                        records.append(record)
+    return records
+
+
+def seed_corpus(path: str, corpus: list, logged: list) -> int:
+    """Append logged raw responses that aren't in the corpus yet; returns how many."""
+    known = {case["raw"] for case in corpus}
+    added = []
+    for record in logged:
+        raw = record.get("raw_response")
+        if raw and raw not in known:
+            known.add(raw)
+            added.append({"raw": raw, "expected": record["generated_sql"],
+                          "note": f"logged: {record.get('question', '')}"})
+    with open(path, "a") as f:
+        for case in added:
+            f.write(json.dumps(case) + "\n")
+    corpus.extend(added)
+    return len(added)
+
+
+def check(name: str, process, cases: list, verbose: bool) -> int:
+    failures = 0
+    for case in cases:
+        got = process(case["raw"])
+        if got != case["expected"]:
+            failures += 1
+            if verbose:
+                print(f"  [{name}] {case.get('note', '')}\n    expected: {case['expected']}\n    got:      {got}")
+    print(f"{name:>8}: {len(cases) - failures}/{len(cases)} corpus outputs as expected")
+    return failures
+
+
+def bench(process, texts: list, repeat: int) -> list:
+    """Per-call times in microseconds, one sample per pass over texts."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            process(text)
+        samples.append((time.perf_counter() - start) / len(texts) * 1e6)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default="data/model_outputs.jsonl")
+    parser.add_argument("--schema", default="data/db.json")
+    parser.add_argument("--query-log", nargs="*", default=[], help="query log files or glob patterns")
+    parser.add_argument("--seed", action="store_true", help="append logged raw responses to the corpus")
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    process = SQLPostProcessor.from_schema_file(args.schema)
+    corpus = load_corpus(args.corpus)
+    logged = load_logged(args.query_log)
+    if args.seed:
+        print(f"seeded {seed_corpus(args.corpus, corpus, logged)} logged responses into {args.corpus}")
+
+    failures = check("pipeline", process, corpus, verbose=True)
+    check("legacy", legacy_postprocess, corpus, verbose=False)
+
+    if logged:
+        changed = [r["generated_sql"] for r in logged if process(r["generated_sql"]) != r["generated_sql"]]
+        for sql in changed[:10]:
+            print(f"  changed on re-run: {sql}")
+        print(f"{'log':>8}: {len(logged) - len(changed)}/{len(logged)} logged SQL unchanged")
+        raws = [r for r in logged if r.get("raw_response")]
+        drifted = [r for r in raws if process(r["raw_response"]) != r["generated_sql"]]
+        for r in drifted[:10]:
+            print(f"  raw response now gives: {process(r['raw_response'])}\n    logged: {r['generated_sql']}")
+        print(f"{'log raw':>8}: {len(raws) - len(drifted)}/{len(raws)} logged responses give the logged SQL")
+        failures += len(changed) + len(drifted)
+
+    texts = [case["raw"] for case in corpus]
+    print(f"\n{'impl':>8} {'mean_us':>9} {'p50_us':>9} {'min_us':>9}")
+    for name, fn in (("legacy", legacy_postprocess), ("pipeline", process)):
+        bench(fn, texts, 10)  # warm up
+        samples = bench(fn, texts, args.repeat)
+        print(f"{name:>8} {statistics.mean(samples):>9.1f} {statistics.median(samples):>9.1f} {min(samples):>9.1f}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
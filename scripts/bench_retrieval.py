@@ -0,0 +1,145 @@
+"""
+Retrieval benchmark: recall and latency of SchemaIndex versus schema size.
+
+Builds synthetic schemas (N tables x ~10 columns, FK chains between tables),
+asks one question per sampled table that names one of its columns, and
+reports hit-rate@k for the target table plus query latency percentiles for:
+  - baseline: one document per table in an IndexFlatL2 (the previous retrieval)
+  - flat:     table/column documents, exact IndexFlatIP, dense only
+  - hybrid:   exact IndexFlatIP + BM25 fusion
+  - ann:      HNSW + BM25 fusion
+Document embeddings are cached, so build_s of the first variant includes encoding.
+
+Usage: python -m scripts.bench_retrieval --sizes 13 100 1000 5000
+"""
+import argparse
+import random
+import time
+
+import faiss
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from src.schema_index import SchemaIndex
+
+ENTITIES = ["user", "order", "invoice", "product", "shipment", "payment", "account", "session",
+            "campaign", "ticket", "device", "region", "supplier", "contract", "review", "event"]
+QUALIFIERS = ["daily", "archive", "staging", "audit", "summary", "raw", "history", "detail"]
+COLUMNS = ["created_at", "updated_at", "status", "amount", "currency", "email", "country", "score",
+           "rank", "quantity", "price", "discount", "title", "description", "is_active", "region_code",
+           "due_date", "paid_at", "rating", "comment", "source", "channel", "priority", "owner_name"]
+
+
+def synthetic_schema(n_tables: int, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    schema = []
+    for i in range(n_tables):
+        name = f"{rnd.choice(QUALIFIERS)}_{rnd.choice(ENTITIES)}_{i}"
+        columns = [f"{name}_id"] + rnd.sample(COLUMNS, 9)
+        fks = {}
+        if schema:
+            parent = rnd.choice(schema)
+            fk_col = parent['attributes'][0]
+            columns.append(fk_col)
+            fks[fk_col] = parent['table']
+        schema.append({
+            "table": name,
+            "description": f"Table: {name}. Stores {name.replace('_', ' ')} records.",
+            "attributes": columns,
+            "foreign_keys": fks,
+        })
+    return schema
+
+
+def questions(schema: list, n: int, seed: int = 1) -> list:
+    rnd = random.Random(seed)
+    out = []
+    for item in rnd.sample(schema, min(n, len(schema))):
+        col = rnd.choice(item['attributes'][1:])
+        out.append((f"show {col.replace('_', ' ')} for {item['table'].replace('_', ' ')}", item['table']))
+    return out
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class CachedEncoder:
+    """Memoize document embeddings so every variant indexes the same vectors."""
+
+    def __init__(self, model):
+        self.model = model
+        self.cache = {}
+
+    def encode(self, texts):
+        missing = [t for t in texts if t not in self.cache]
+        if missing:
+            for text, emb in zip(missing, self.model.encode(missing, batch_size=256)):
+                self.cache[text] = emb
+        return np.stack([self.cache[t] for t in texts])
+
+
+class BaselineIndex:
+    """The retrieval before SchemaIndex: table descriptions in an IndexFlatL2."""
+
+    def __init__(self, schema: list, encode):
+        self.tables = [item['table'] for item in schema]
+        embeddings = np.asarray(encode([SchemaIndex.describe_table(item) for item in schema]), dtype='float32')
+        self.index = faiss.IndexFlatL2(embeddings.shape[1])
+        self.index.add(embeddings)  # type: ignore
+
+    def search(self, query: str, top_k: int = 5, query_embedding=None) -> list:
+        distances, ids = self.index.search(np.asarray(query_embedding, dtype='float32'), top_k)  # type: ignore
+        return [(self.tables[i], -float(d)) for d, i in zip(distances[0], ids[0]) if i >= 0]
+
+
+def run(index, qs: list, encoder, top_k: int) -> dict:
+    hits, latencies = 0, []
+    for question, target in qs:
+        emb = encoder.encode([question])
+        start = time.perf_counter()
+        result = index.search(question, top_k=top_k, query_embedding=emb)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += any(table == target for table, _ in result)
+    return {
+        "recall": hits / len(qs),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[13, 100, 1000, 5000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    args = parser.parse_args()
+
+    encoder = CachedEncoder(SentenceTransformer(args.model))
+    variants = {
+        "baseline": None,
+        "flat": dict(ann_threshold=10**9, lexical_weight=0.0),
+        "hybrid": dict(ann_threshold=10**9, lexical_weight=0.3),
+        "ann": dict(ann_threshold=0, lexical_weight=0.3),
+    }
+
+    print(f"{'tables':>7} {'variant':>9} {'build_s':>8} {'recall@k':>9} {'p50_ms':>8} {'p95_ms':>8}")
+    for size in args.sizes:
+        schema = synthetic_schema(size)
+        qs = questions(schema, args.queries)
+        for name, params in variants.items():
+            start = time.perf_counter()
+            if params is None:
+                index = BaselineIndex(schema, encoder.encode)
+            else:
+                index = SchemaIndex(schema, encode=encoder.encode, **params)
+            build_s = time.perf_counter() - start
+            stats = run(index, qs, encoder, args.top_k)
+            print(f"{size:>7} {name:>9} {build_s:>8.2f} {stats['recall']:>9.3f} "
+                  f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
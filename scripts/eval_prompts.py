@@ -0,0 +1,98 @@
+"""
+Prompt size vs accuracy for token-budgeted schema context.
+
+For every question in test_queries.json, builds the prompt with the full
+context (descriptions + DDL, "full") and with each token budget, and reports
+the prompt size counted with the model's tokenizer. With --generate, also
+sends each prompt to Ollama and executes the SQL on the database, reporting
+the prompt tokens and prompt-eval time Ollama measured and the share of
+questions whose SQL executed without error (per category and overall).
+
+Usage: python -m scripts.eval_prompts --budgets full 1024 768 512 [--generate]
+"""
+import argparse
+import json
+from collections import defaultdict
+
+from src.rag_sql import RAGSQL
+from src.schema_context import DEFAULT_TOKENIZER
+
+QUERIES_FILE = "test_queries.json"
+
+
+def load_queries() -> list:
+    with open(QUERIES_FILE) as f:
+        data = json.load(f)
+    return [(cat["category"], q["query"]) for cat in data["test_queries"] for q in cat["queries"]]
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def mean(values: list) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def evaluate(rag: RAGSQL, queries: list, generate: bool, top_k: int) -> dict:
+    counted, model_tokens, eval_s = [], [], []
+    executed = defaultdict(list)
+    for category, query in queries:
+        prompt = rag.build_prompt(query, top_k)
+        counted.append(rag.token_counter.count(prompt))
+        if not generate:
+            continue
+
+        response = rag.sql_agent.generate_response(prompt)
+        if response.get("prompt_tokens") is not None:
+            model_tokens.append(response["prompt_tokens"])
+            eval_s.append(response["prompt_eval_s"])
+        ok = bool(response.get("raw"))
+        if ok:
+            try:
+                rag.execute_sql(response["processed"], limit=1)
+            except ValueError:
+                ok = False
+        executed[category].append(ok)
+    return {"counted": counted, "model_tokens": model_tokens, "eval_s": eval_s, "executed": executed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budgets", nargs="+", default=["full", "1024", "768", "512"],
+                        help="'full' for the unbudgeted context, otherwise prompt token budgets")
+    parser.add_argument("--generate", action="store_true", help="call Ollama and execute the SQL")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--tokenizer", default=DEFAULT_TOKENIZER, help="tokenizer.json path or hub repo id")
+    parser.add_argument("--download", action="store_true", help="fetch a hub tokenizer that isn't cached")
+    args = parser.parse_args()
+
+    queries = load_queries()
+    rag = RAGSQL(prompt_token_budget=None, tokenizer=args.tokenizer, tokenizer_download=args.download)
+
+    print(f"{'budget':>7} {'tokens':>7} {'max':>5} {'model_tok':>9} {'eval_s':>7} {'eval_p95':>8} {'executed':>9}")
+    per_category = {}
+    for budget in args.budgets:
+        rag.prompt_token_budget = None if budget == "full" else int(budget)
+        res = evaluate(rag, queries, args.generate, args.top_k)
+        line = f"{budget:>7} {mean(res['counted']):>7.0f} {max(res['counted']):>5}"
+        if args.generate:
+            outcomes = [ok for oks in res["executed"].values() for ok in oks]
+            p95 = percentile(res["eval_s"], 95) if res["eval_s"] else 0.0
+            line += (f" {mean(res['model_tokens']):>9.0f} {mean(res['eval_s']):>7.2f} {p95:>8.2f}"
+                     f" {mean(outcomes):>9.0%}")
+            per_category[budget] = {cat: mean(oks) for cat, oks in res["executed"].items()}
+        print(line)
+
+    if per_category:
+        print("\nexecuted by category:")
+        categories = list(next(iter(per_category.values())))
+        print(f"{'category':>28} " + ' '.join(f"{b:>7}" for b in per_category))
+        for cat in categories:
+            print(f"{cat[:28]:>28} " + ' '.join(f"{per_category[b][cat]:>7.0%}" for b in per_category))
+    rag.close()
+
+
+if __name__ == "__main__":
+    main()
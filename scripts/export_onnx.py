@@ -0,0 +1,52 @@
+"""
+Export all-MiniLM-L6-v2 to ONNX and quantize it to int8 for the "onnx"
+embedding backend (src/embeddings.py). Needs torch/transformers only here,
+at export time; the service itself then runs on onnxruntime.
+
+Usage: python -m scripts.export_onnx --out models/all-MiniLM-L6-v2-int8
+"""
+import argparse
+import os
+
+import torch
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from transformers import AutoModel, AutoTokenizer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--out", default="models/all-MiniLM-L6-v2-int8")
+    parser.add_argument("--no-quantize", action="store_true", help="keep fp32 weights")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModel.from_pretrained(args.model).eval()
+
+    sample = tokenizer(["example query"], return_tensors="pt")
+    fp32_path = os.path.join(args.out, "model-fp32.onnx")
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={name: {0: "batch", 1: "seq"} for name in
+                      ["input_ids", "attention_mask", "token_type_ids", "last_hidden_state"]},
+        opset_version=17,
+    )
+
+    model_path = os.path.join(args.out, "model.onnx")
+    if args.no_quantize:
+        os.replace(fp32_path, model_path)
+    else:
+        quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+
+    tokenizer.backend_tokenizer.save(os.path.join(args.out, "tokenizer.json"))
+    print(f"Saved {model_path} and tokenizer.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Download the generation model's tokenizer once, for prompt token counting
+(src/schema_context.py), so the service loads it from disk instead of the
+Hugging Face Hub in every process.
+
+Usage: python -m scripts.fetch_tokenizer --repo defog/sqlcoder --out models/sqlcoder/tokenizer.json
+"""
+import argparse
+import os
+
+from tokenizers import Tokenizer
+
+from src.schema_context import DEFAULT_TOKENIZER
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repo", default="defog/sqlcoder")
+    parser.add_argument("--out", default=DEFAULT_TOKENIZER)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    Tokenizer.from_pretrained(args.repo).save(args.out)
+    print(f"Saved {args.repo} tokenizer to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
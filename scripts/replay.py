@@ -0,0 +1,144 @@
+"""
+Replay a recorded query log (logs/queries.jsonl, see src/query_log.py) against
+a running API.
+
+Requests are sent open-loop at their recorded arrival times divided by
+--speed (2 = twice the recorded rate), or at a fixed --rate per second, with
+at most --concurrency in flight; a request whose slot isn't free yet starts
+late and the delay is reported as schedule lag. Each request keeps its
+client id, tenant and output format. Reports throughput, status codes and
+latency percentiles per endpoint.
+
+Usage: python -m scripts.replay logs/queries.jsonl* --speed 2 --concurrency 8
+"""
+import argparse
+import glob
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ENDPOINTS = ("/generate-sql", "/execute-sql")
+
+
+def percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def load_log(patterns: list, endpoints: set, limit: int = None) -> list:
+    paths = sorted({p for pattern in patterns for p in glob.glob(pattern)})
+    entries = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if entry.get("endpoint") in endpoints and entry.get("question"):
+                    entries.append(entry)
+    entries.sort(key=lambda e: e["ts"])
+    return entries[:limit] if limit else entries
+
+
+def schedule(entries: list, speed: float, rate: float = None) -> list:
+    """Offsets in seconds from the start of the replay."""
+    if rate:
+        return [i / rate for i in range(len(entries))]
+    start = entries[0]["ts"]
+    return [(e["ts"] - start) / speed for e in entries]
+
+
+_local = threading.local()
+
+
+def send(base_url: str, entry: dict, timeout: float) -> tuple:
+    """(status, latency_s, bytes); status 0 on connection errors."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+
+    request = dict(entry.get("request") or {})
+    headers = {"X-Client-Id": entry.get("client_id") or "replay", "X-Request-Timeout": str(timeout)}
+    accept = request.pop("accept", None)
+    if accept:
+        headers["Accept"] = accept
+    body = {"query": entry["question"], **request}
+
+    start = time.perf_counter()
+    try:
+        response = session.post(base_url + entry["endpoint"], json=body, headers=headers,
+                                timeout=timeout, stream=True)
+        size = sum(len(chunk) for chunk in response.iter_content(64 * 1024))
+        return response.status_code, time.perf_counter() - start, size
+    except requests.RequestException:
+        return 0, time.perf_counter() - start, 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="log files or glob patterns")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiplier of the recorded rate")
+    parser.add_argument("--rate", type=float, default=None, help="fixed requests/s instead of recorded times")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N requests")
+    parser.add_argument("--endpoint", choices=ENDPOINTS, action="append", help="default: both")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    entries = load_log(args.logs, set(args.endpoint or ENDPOINTS), args.limit)
+    if not entries:
+        raise SystemExit("No replayable requests in the log")
+    offsets = schedule(entries, args.speed, args.rate)
+    print(f"Replaying {len(entries)} requests over {offsets[-1]:.1f}s scheduled, "
+          f"concurrency {args.concurrency}")
+
+    results = []  # (endpoint, status, latency_s, lag_s, bytes)
+    lock = threading.Lock()
+    slots = threading.Semaphore(args.concurrency)
+
+    def run(entry: dict, due: float):
+        lag = max(0.0, time.perf_counter() - due)
+        try:
+            status, latency, size = send(args.base_url, entry, args.timeout)
+        finally:
+            slots.release()
+        with lock:
+            results.append((entry["endpoint"], status, latency, lag, size))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for entry, offset in zip(entries, offsets):
+            due = start + offset
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            slots.acquire()
+            pool.submit(run, entry, due)
+    elapsed = time.perf_counter() - start
+
+    ok = sum(1 for r in results if 200 <= r[1] < 300)
+    print(f"\nDone in {elapsed:.1f}s: {len(results) / elapsed:.2f} req/s, {ok / elapsed:.2f} successful req/s")
+    print(f"status codes: {dict(sorted(Counter(r[1] for r in results).items()))}")
+    lags = [r[3] for r in results]
+    print(f"schedule lag: p50 {percentile(lags, 50):.3f}s  p95 {percentile(lags, 95):.3f}s  max {max(lags):.3f}s")
+
+    by_endpoint = defaultdict(list)
+    for r in results:
+        by_endpoint[r[0]].append(r)
+    print(f"\n{'endpoint':>14} {'count':>6} {'ok':>6} {'p50_s':>8} {'p95_s':>8} {'p99_s':>8} {'max_s':>8} {'mb':>8}")
+    for endpoint, rows in sorted(by_endpoint.items()):
+        latencies = [r[2] for r in rows if 200 <= r[1] < 300] or [r[2] for r in rows]
+        print(f"{endpoint:>14} {len(rows):>6} {sum(1 for r in rows if 200 <= r[1] < 300):>6} "
+              f"{percentile(latencies, 50):>8.3f} {percentile(latencies, 95):>8.3f} "
+              f"{percentile(latencies, 99):>8.3f} {max(latencies):>8.3f} "
+              f"{sum(r[4] for r in rows) / 2**20:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
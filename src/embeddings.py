@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SentenceTransformerEmbedder:
+    """PyTorch SentenceTransformer backend (torch is imported on first use)."""
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts), dtype='float32')
+
+
+class OnnxEmbedder:
+    """
+    onnxruntime backend for an ONNX-exported (optionally int8-quantized) MiniLM,
+    see scripts/export_onnx.py. Mean pooling + L2 normalization, matching
+    all-MiniLM-L6-v2's SentenceTransformer pipeline.
+    """
+
+    def __init__(self, model_dir: str = "models/all-MiniLM-L6-v2-int8",
+                 num_threads: int = 1, max_length: int = 256):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(os.path.join(model_dir, "model.onnx"), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        logger.info(f"ONNX embedder loaded from {model_dir} ({num_threads} threads)")
+
+    def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            ids = np.array([e.ids for e in batch], dtype='int64')
+            mask = np.array([e.attention_mask for e in batch], dtype='int64')
+            feed = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feed["token_type_ids"] = np.zeros_like(ids)
+
+            hidden = self.session.run(None, feed)[0]
+            weights = mask[..., None].astype('float32')
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.append(pooled.astype('float32'))
+        return np.concatenate(out) if out else np.zeros((0, 0), dtype='float32')
+
+
+class CachedEmbedder:
+    """
+    Wraps a backend with an LRU cache of query embeddings keyed by normalized
+    text (lowercased, collapsed whitespace). Document encoding is not cached.
+    """
+
+    def __init__(self, backend, maxsize: int = 1024):
+        self.backend = backend
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return ' '.join(text.lower().split())
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.backend.encode(texts)
+
+    def encode_query(self, query: str) -> np.ndarray:
+        key = self.normalize(query)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        # MiniLM's tokenizer is uncased, so encoding the normalized key is lossless
+        embedding = self.backend.encode([key])
+        if self.maxsize > 0:
+            with self._lock:
+                self._cache[key] = embedding
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        return embedding
+
+
+def load_embedder(backend: str = "sentence-transformers",
+                  model_name: str = "all-MiniLM-L6-v2",
+                  onnx_model_dir: str = "models/all-MiniLM-L6-v2-int8",
+                  num_threads: int = 1,
+                  query_cache_size: int = 1024) -> CachedEmbedder:
+    if backend == "sentence-transformers":
+        impl = SentenceTransformerEmbedder(model_name)
+    elif backend == "onnx":
+        impl = OnnxEmbedder(onnx_model_dir, num_threads=num_threads)
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+    return CachedEmbedder(impl, maxsize=query_cache_size)
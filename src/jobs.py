@@ -0,0 +1,398 @@
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+from src.metrics import metrics
+from src.replicas import PRIMARY
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+EXPIRED = "expired"  # done, but the result file was removed after result_ttl_s
+FINAL_STATES = {DONE, FAILED, CANCELLED, EXPIRED}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    query TEXT NOT NULL,
+    status TEXT NOT NULL,
+    generated_sql TEXT,
+    error TEXT,
+    row_count INTEGER,
+    result_path TEXT,
+    worker_pid INTEGER,
+    backend_pid INTEGER,
+    backend_server TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """
+    SQLite-backed job queue shared by the API process and the workers.
+    Each call opens its own connection, so it is safe across processes.
+    """
+
+    def __init__(self, path: str = 'data/jobs.sqlite'):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "backend_server" not in columns:  # queue created before read replicas
+                conn.execute("ALTER TABLE jobs ADD COLUMN backend_server TEXT")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, query: str, tenant: str = "default") -> str:
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, tenant, query, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, tenant, query, QUEUED, time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim(self, worker_pid: int) -> Optional[dict]:
+        """Atomically move the oldest queued job to running."""
+        with self._connect() as conn:
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute(
+                    "SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker_pid = ?, started_at = ? WHERE job_id = ?",
+                    (RUNNING, worker_pid, time.time(), row["job_id"]),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row["job_id"])
+
+    def update(self, job_id: str, only_if_status: str = None, **fields) -> bool:
+        """Update fields; with only_if_status, only while the job is still in that state."""
+        assignments = ', '.join(f"{k} = ?" for k in fields)
+        sql = f"UPDATE jobs SET {assignments} WHERE job_id = ?"
+        params = list(fields.values()) + [job_id]
+        if only_if_status:
+            sql += " AND status = ?"
+            params.append(only_if_status)
+        with self._connect() as conn:
+            return conn.execute(sql, params).rowcount > 0
+
+    def cancel(self, job_id: str) -> bool:
+        """Queued/running -> cancelled in one statement; False if the job had already finished."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE job_id = ? AND status IN (?, ?)",
+                (CANCELLED, time.time(), job_id, QUEUED, RUNNING),
+            ).rowcount > 0
+
+    def expire(self, finished_before: float) -> list:
+        """Mark done jobs finished before the cutoff as expired; returns their result paths."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT job_id, result_path FROM jobs WHERE status = ? AND finished_at < ?",
+                                (DONE, finished_before)).fetchall()
+            paths = []
+            for row in rows:
+                if conn.execute("UPDATE jobs SET status = ?, result_path = NULL WHERE job_id = ? AND status = ?",
+                                (EXPIRED, row["job_id"], DONE)).rowcount and row["result_path"]:
+                    paths.append(row["result_path"])
+        return paths
+
+    def result_paths(self) -> set:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT result_path FROM jobs WHERE status = ? AND result_path IS NOT NULL",
+                                (DONE,)).fetchall()
+        return {row["result_path"] for row in rows}
+
+    def running_job_ids(self) -> set:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT job_id FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+        return {row["job_id"] for row in rows}
+
+    def fail_worker_jobs(self, worker_pid: int, error: str) -> int:
+        """Running jobs of a worker that died fail (not requeued: the job may be what killed it)."""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, backend_pid = NULL, finished_at = ? "
+                "WHERE status = ? AND worker_pid = ?",
+                (FAILED, error, time.time(), RUNNING, worker_pid),
+            ).rowcount
+
+    def requeue_orphans(self, live_pids: set):
+        """Jobs left running by a dead worker go back to the queue."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT job_id, worker_pid FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            for row in rows:
+                if row["worker_pid"] not in live_pids:
+                    conn.execute("UPDATE jobs SET status = ?, worker_pid = NULL, backend_pid = NULL "
+                                 "WHERE job_id = ? AND status = ?", (QUEUED, row["job_id"], RUNNING))
+
+
+def _write_result(rag, sql: str, path: str, on_connect, max_rows: int, batch_size: int) -> int:
+    """
+    Spill the result to gzip-compressed NDJSON: a header line with the column
+    names, then one JSON array per row. Written to a temp file, then renamed.
+    """
+    tmp_path = path + ".tmp"
+    rows = 0
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=3) as f:
+            header_written = False
+            for columns, batch in rag.stream_sql(sql, limit=max_rows, batch_size=batch_size, on_connect=on_connect):
+                if not header_written:
+                    f.write(json.dumps({"columns": columns}) + "\n")
+                    header_written = True
+                f.writelines(json.dumps(list(row), default=str) + "\n" for row in batch)
+                rows += len(batch)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return rows
+
+
+def _run_job(store: JobStore, tenants, job: dict, results_dir: str, max_rows: int, batch_size: int):
+    job_id = job["job_id"]
+    with tenants.acquire(job["tenant"]) as rag:
+        response = rag.generate_sql(job["query"])
+        sql = response.get("processed", "")
+        if not response.get("raw"):
+            raise ValueError(sql or "Empty response from model")
+        # generation can't be interrupted; stop here if cancelled meanwhile
+        if not store.update(job_id, only_if_status=RUNNING, generated_sql=sql):
+            return
+
+        def on_connect(backend_pid: int, server: str):
+            # publish the backend (pid + primary/replica) for pg_cancel_backend; abort if cancelled already
+            if not store.update(job_id, only_if_status=RUNNING, backend_pid=backend_pid, backend_server=server):
+                raise RuntimeError("Job cancelled")
+
+        path = os.path.join(results_dir, f"{job_id}.ndjson.gz")
+        rows = _write_result(rag, sql, path, on_connect, max_rows, batch_size)
+
+    if not store.update(job_id, only_if_status=RUNNING, status=DONE, row_count=rows,
+                        result_path=path, backend_pid=None, finished_at=time.time()):
+        # cancelled while the query ran: a pg_cancel_backend sent between
+        # on_connect and the statement start doesn't stop it, so drop the result
+        os.remove(path)
+
+
+def _worker_main(db_path: str, results_dir: str, rag_kwargs: dict, max_rows: int,
+                 batch_size: int, poll_s: float, generation_slots, job_deadline_s: float):
+    # imported here: the worker loads its own models after spawn
+    from src.embeddings import load_embedder
+    from src.model import SQLCoderAgent
+    from src.scheduler import GenerationScheduler, RequestContext, request_context
+    from src.tenants import TenantManager, load_tenants
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    store = JobStore(db_path)
+    # generations take a permit shared with the API's scheduler, so they count against its max_concurrent
+    scheduler = GenerationScheduler(max_concurrent=1, slots=generation_slots) if generation_slots else None
+    tenants = TenantManager(load_tenants(), embedder=load_embedder(), sql_agent=SQLCoderAgent(scheduler=scheduler),
+                            max_loaded=2, rag_kwargs=rag_kwargs)
+    pid = os.getpid()
+    logger.info(f"Job worker {pid} ready")
+
+    while True:
+        job = store.claim(pid)
+        if job is None:
+            time.sleep(poll_s)
+            continue
+        token = request_context.set(RequestContext(f"job:{pid}", time.monotonic() + job_deadline_s))
+        try:
+            _run_job(store, tenants, job, results_dir, max_rows, batch_size)
+        except Exception as e:
+            logger.error(f"Job {job['job_id']} failed: {e}")
+            store.update(job["job_id"], only_if_status=RUNNING, status=FAILED, error=str(e),
+                         backend_pid=None, finished_at=time.time())
+        finally:
+            request_context.reset(token)
+
+
+class JobManager:
+    """
+    Submit -> job id -> poll -> fetch. Jobs run on a bounded pool of worker
+    processes (spawned, each with its own models and tenant pools) fed from
+    the SQLite queue; results are spilled to results_dir.
+    A maintenance thread checks the workers every supervise_interval_s: a dead
+    worker's running job fails and the worker is respawned. Every
+    cleanup_interval_s it removes results result_ttl_s after the job finished
+    (the job becomes "expired"), and files in results_dir that neither a done
+    nor a running job owns once they are older than orphan_grace_s.
+    generation_slots: the API scheduler's GenerationSlots; workers wait for a
+    permit (up to job_deadline_s) before each generation, and a permit held by
+    a worker that died is released when it is respawned.
+    """
+
+    def __init__(self,
+                 db_path: str = 'data/jobs.sqlite',
+                 results_dir: str = 'data/job_results',
+                 num_workers: int = 2,
+                 max_rows: int = 1_000_000,
+                 batch_size: int = 10_000,
+                 poll_s: float = 0.5,
+                 rag_kwargs: dict = None,
+                 result_ttl_s: float = 24 * 3600,
+                 orphan_grace_s: float = 3600,
+                 cleanup_interval_s: float = 600,
+                 supervise_interval_s: float = 5,
+                 generation_slots=None,
+                 job_deadline_s: float = 3600):
+        os.makedirs(results_dir, exist_ok=True)
+        self.store = JobStore(db_path)
+        self.db_path = db_path
+        self.results_dir = results_dir
+        self.num_workers = num_workers
+        self.max_rows = max_rows
+        self.batch_size = batch_size
+        self.poll_s = poll_s
+        self.rag_kwargs = rag_kwargs or {}
+        self.result_ttl_s = result_ttl_s
+        self.orphan_grace_s = orphan_grace_s
+        self.cleanup_interval_s = cleanup_interval_s
+        self.supervise_interval_s = supervise_interval_s
+        self.generation_slots = generation_slots
+        self.job_deadline_s = job_deadline_s
+        self.workers = []
+        self._workers_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._maintainer = threading.Thread(target=self._maintenance_loop, name="job-maintenance", daemon=True)
+
+    def _spawn(self):
+        proc = multiprocessing.get_context("spawn").Process(
+            target=_worker_main,
+            args=(self.db_path, self.results_dir, self.rag_kwargs, self.max_rows, self.batch_size, self.poll_s,
+                  self.generation_slots, self.job_deadline_s),
+            daemon=True,
+        )
+        proc.start()
+        return proc
+
+    def start(self):
+        with self._workers_lock:
+            if self.workers:
+                return
+            self.workers = [self._spawn() for _ in range(self.num_workers)]
+            self.store.requeue_orphans({p.pid for p in self.workers})
+        self._maintainer.start()
+        logger.info(f"Started {self.num_workers} job workers")
+
+    def stop(self):
+        self._stop.set()
+        with self._workers_lock:
+            for proc in self.workers:
+                proc.terminate()
+            for proc in self.workers:
+                proc.join(timeout=5)
+            self.workers = []
+
+    def supervise(self) -> int:
+        """Fail the running jobs of dead workers and respawn them; returns how many were respawned."""
+        respawned = 0
+        with self._workers_lock:
+            for i, proc in enumerate(self.workers):
+                if proc.is_alive() or self._stop.is_set():
+                    continue
+                error = f"Job worker {proc.pid} exited with code {proc.exitcode}"
+                failed = self.store.fail_worker_jobs(proc.pid, error)
+                logger.error(f"{error}; failed {failed} running job(s), respawning")
+                metrics.increment("job_worker_restarts")
+                if self.generation_slots is not None and self.generation_slots.release_dead(proc.pid):
+                    logger.warning(f"Released the generation permit held by dead worker {proc.pid}")
+                self.workers[i] = self._spawn()
+                respawned += 1
+        return respawned
+
+    def cleanup(self) -> int:
+        """Delete expired and orphaned result files; returns how many were removed."""
+        now = time.time()
+        removed = 0
+        for path in self.store.expire(now - self.result_ttl_s):
+            if os.path.exists(path):
+                os.remove(path)
+                removed += 1
+        referenced = self.store.result_paths()
+        # files (final or .tmp) of running jobs are still being written, however long the query takes
+        running = self.store.running_job_ids()
+        for name in os.listdir(self.results_dir):
+            path = os.path.join(self.results_dir, name)
+            if name.split(".", 1)[0] in running:
+                continue
+            try:
+                if path not in referenced and now - os.path.getmtime(path) > self.orphan_grace_s:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        if removed:
+            logger.info(f"Removed {removed} job result files")
+        return removed
+
+    def _maintenance_loop(self):
+        next_cleanup = 0.0
+        while True:
+            try:
+                self.supervise()
+            except Exception as e:
+                logger.error(f"Job worker supervision failed: {e}")
+            if time.monotonic() >= next_cleanup:
+                next_cleanup = time.monotonic() + self.cleanup_interval_s
+                try:
+                    self.cleanup()
+                except Exception as e:
+                    logger.error(f"Job result cleanup failed: {e}")
+            if self._stop.wait(self.supervise_interval_s):
+                return
+
+    def submit(self, query: str, tenant: str = "default") -> str:
+        return self.store.submit(query, tenant)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.store.get(job_id)
+
+    def cancel(self, job_id: str, tenants) -> Optional[dict]:
+        """
+        Mark the job cancelled; if its query is already running, cancel the
+        statement on the tenant's database with pg_cancel_backend.
+        """
+        if not self.store.cancel(job_id):
+            return self.store.get(job_id)  # unknown or already finished
+        job = self.store.get(job_id)
+        if job["backend_pid"]:
+            tenants.cancel_backend(job["tenant"], job["backend_pid"], job["backend_server"] or PRIMARY)
+        return job
@@ -0,0 +1,63 @@
+import threading
+from collections import defaultdict, deque
+from typing import Optional
+
+
+class Metrics:
+    """
+    Minimal in-process metrics registry: labelled counters plus bounded
+    samples of observed values (latencies, sizes) for percentile reporting.
+    """
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+
+    @staticmethod
+    def _key(name: str, labels: Optional[dict]) -> str:
+        if not labels:
+            return name
+        rendered = ','.join(f"{k}={labels[k]}" for k in sorted(labels))
+        return f"{name}{{{rendered}}}"
+
+    def increment(self, name: str, labels: Optional[dict] = None, value: int = 1):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name: str, value: float, labels: Optional[dict] = None):
+        key = self._key(name, labels)
+        with self._lock:
+            self._samples[key].append(value)
+
+    @staticmethod
+    def _percentile(values: list, pct: float) -> float:
+        idx = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+        return values[idx]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {k: sorted(v) for k, v in self._samples.items() if v}
+
+        summaries = {}
+        for key, values in samples.items():
+            summaries[key] = {
+                "count": len(values),
+                "mean": sum(values) / len(values),
+                "p50": self._percentile(values, 50),
+                "p95": self._percentile(values, 95),
+                "p99": self._percentile(values, 99),
+                "max": values[-1],
+            }
+        return {"counters": counters, "observations": summaries}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._samples.clear()
+
+
+metrics = Metrics()
@@ -1,22 +1,80 @@
 import requests
 import json
 import logging
+import time
 from typing import Optional
+from src.metrics import metrics
+from src.query_log import trace_set, trace_stage
+from src.scheduler import GenerationScheduler, request_context
+from src.sql_postprocess import SQLPostProcessor
 
 # setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class SQLCoderAgent:
-    def __init__(self, model_name: str = "sqlcoder:15b"):
+    def __init__(self, model_name: str = "sqlcoder:15b", scheduler: GenerationScheduler = None,
+                 keep_alive=-1, postprocessor: SQLPostProcessor = None):
         self.model_name = model_name
         self.url = "http://localhost:11434/api/generate"
+        self.ps_url = "http://localhost:11434/api/ps"
+        # how long Ollama keeps the model in memory after a request ("30m", seconds); -1 = until unloaded
+        self.keep_alive = keep_alive
+        # optional admission control; applies when the caller set a request_context
+        self.scheduler = scheduler
+        # raw output -> SQL; callers with their own schema pass one per request
+        self.postprocessor = postprocessor or SQLPostProcessor.from_schema_file()
         logger.info(f"Ollama SQLCoderAgent initialized for model: {self.model_name}")
 
-    def generate_response(self, prompt: Optional[str]):
+    def generate_response(self, prompt: Optional[str], timeout: float = 90,
+                          postprocessor: SQLPostProcessor = None):
+        """
+        Generate SQL for the prompt. Under a scheduler, waits for a generation
+        slot first (raising Overloaded when rejected) and caps the request
+        timeout at the caller's deadline. postprocessor overrides the agent's.
+        """
         if not prompt:
             return {"raw": "", "processed": "Error: Prompt is empty. Please provide a valid prompt."}
 
+        ctx = request_context.get()
+        if self.scheduler is None or ctx is None:
+            with trace_stage("generate"):
+                return self._generate(prompt, timeout, postprocessor)
+
+        with trace_stage("queue"):
+            self.scheduler.acquire(ctx.client_id, ctx.deadline)
+        start = time.monotonic()
+        result = None
+        try:
+            timeout = max(1.0, min(timeout, ctx.deadline - start))
+            with trace_stage("generate"):
+                result = self._generate(prompt, timeout, postprocessor)
+            return result
+        finally:
+            completed = bool(result and result.get("raw"))
+            self.scheduler.release(time.monotonic() - start if completed else None)
+
+    def warmup(self, timeout: float = 600):
+        """
+        Load the model into Ollama's memory (a request without a prompt only
+        loads it) and keep it resident for keep_alive. Raises on failure.
+        """
+        payload = {"model": self.model_name, "keep_alive": self.keep_alive, "stream": False}
+        response = requests.post(self.url, json=payload, timeout=timeout)
+        response.raise_for_status()
+        result = response.json()
+        logger.info(f"Ollama model {self.model_name} loaded in {result.get('load_duration', 0) / 1e9:.2f}s")
+
+    def check_loaded(self, timeout: float = 5):
+        """Raise unless Ollama currently has the model in memory (/api/ps)."""
+        response = requests.get(self.ps_url, timeout=timeout)
+        response.raise_for_status()
+        models = response.json().get("models", [])
+        loaded = {m.get("name") for m in models} | {m.get("model") for m in models}
+        if self.model_name not in loaded:
+            raise RuntimeError(f"Ollama model {self.model_name} is not loaded")
+
+    def _generate(self, prompt: str, timeout: float, postprocessor: SQLPostProcessor = None):
         logger.info(f"Sending request to Ollama for model {self.model_name}...")
         logger.info(f"Prompt ends with: ...{prompt[-100:]}")
 
@@ -24,6 +82,7 @@ class SQLCoderAgent:
             "model": self.model_name,
             "prompt": prompt,
             "stream": False,
+            "keep_alive": self.keep_alive,
             "options": {
                 "temperature": 0.0,
                 "num_predict": 600
@@ -31,7 +90,7 @@ class SQLCoderAgent:
         }
 
         try:
-            response = requests.post(self.url, json=payload, timeout=90)
+            response = requests.post(self.url, json=payload, timeout=timeout)
             response.raise_for_status()
             result = response.json()
             raw_text = result.get("response", "").strip()
@@ -39,51 +98,26 @@ class SQLCoderAgent:
             # debug response metadata
             logger.info(f"Response done: {result.get('done', False)}")
             logger.info(f"Response length: {len(raw_text)} characters")
-            logger.info(f"Raw response from Ollama: {raw_text}")
-
-
-            text = raw_text
 
-            if not text:
-                logger.warning("Empty response from Ollama. Model may not be loaded or prompt format issue.")
-                return {"raw": raw_text, "processed": ""}
-
-            import re
-
-            # extract SQL from ```sql code block
-            sql_match = re.search(r'```sql\s*([^`]+)\s*```', text, re.IGNORECASE | re.DOTALL)
-            if sql_match:
-                text = sql_match.group(1)
-            else:
-                # fallback: try to extract without code block
-                text = text.replace("<s>", "").replace("</s>", "").replace("[SQL]", "")
-                for delimiter in ["[QUESTION]", "[/QUESTION]", "###", "[/SQL]", "## Response", "```"]:
-                    if delimiter in text:
-                        text = text.split(delimiter)[0]
-
-            text = text.strip()
-
-            # remove extra content after semicolon
-            text = re.sub(r';(\s*\n){2,}.*$', ';', text, flags=re.DOTALL)
-
-            # fix common table name errors
-            table_fixes = {
-                r'\bcompetitions\b': 'competition',
-                r'\bevaluations\b': 'evaluation',
-                r'\bsubmissions\b': 'submission',
-                r'\bparticipations\b': 'participation',
-                r'\bdatasets\b': 'dataset',
-                r'\busers\b': '"user"',
+            # prompt size as the model saw it, and the time spent evaluating it
+            usage = {
+                "prompt_tokens": result.get("prompt_eval_count"),
+                "prompt_eval_s": result.get("prompt_eval_duration", 0) / 1e9,
             }
-            for pattern, replacement in table_fixes.items():
-                text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-
-            # normalize whitespace
-            text = ' '.join(text.split())
-            text = text.strip()
+            if usage["prompt_tokens"] is not None:
+                metrics.observe("prompt_tokens", usage["prompt_tokens"])
+                metrics.observe("prompt_eval_s", usage["prompt_eval_s"])
+            logger.debug(f"Raw response from Ollama: {raw_text}")
+            # recorded in the query log, so post-processing can be checked against real outputs
+            trace_set(raw_response=raw_text)
+
+            if not raw_text:
+                logger.warning("Empty response from Ollama. Model may not be loaded or prompt format issue.")
+                return {"raw": raw_text, "processed": "", **usage}
 
+            text = (postprocessor or self.postprocessor)(raw_text)
             logger.info(f"Generated SQL: {text}")
-            return {"raw": raw_text, "processed": text}
+            return {"raw": raw_text, "processed": text, **usage}
 
         except Exception as e:
             logger.error(f"Error connecting to Ollama: {e}")
@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import orjson
+
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# per-request record, set by the API; pipeline stages add their fields and timings
+current_trace: ContextVar[Optional[dict]] = ContextVar("current_trace", default=None)
+
+
+def trace_set(**fields):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+@contextmanager
+def trace_stage(name: str):
+    """Add the stage's wall time to timings[<name>_s] (summed over repeats, e.g. repairs)."""
+    trace = current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            timings = trace.setdefault("timings", {})
+            key = f"{name}_s"
+            timings[key] = round(timings.get(key, 0.0) + time.perf_counter() - start, 4)
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:16]
+
+
+class QueryLog:
+    """
+    Append-only JSON-lines log of API requests. record() only enqueues; a
+    background thread serializes and writes, rotating the file at max_bytes
+    (queries.jsonl -> queries.jsonl.1 -> ... up to backup_count). When the
+    queue is full, records are dropped (counted in query_log_dropped) rather
+    than slowing requests down.
+    """
+
+    def __init__(self, path: str = 'logs/queries.jsonl', max_bytes: int = 64 * 2**20,
+                 backup_count: int = 10, queue_size: int = 10_000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+        self._file = None
+
+    def start(self):
+        if self._thread.is_alive():
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.path, 'ab')
+        self._thread.start()
+
+    def stop(self):
+        """Flush what's queued and close the file."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=10)
+
+    def record(self, entry: dict):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            metrics.increment("query_log_dropped")
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'ab')
+
+    def _run(self):
+        while True:
+            entries = [self._queue.get()]
+            # drain whatever else is waiting into the same write
+            while len(entries) < 1000:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in entries
+            try:
+                data = b''.join(orjson.dumps(e, default=str) + b'\n' for e in entries if e is not None)
+                if data:
+                    if self._file.tell() + len(data) > self.max_bytes and self._file.tell() > 0:
+                        self._rotate()
+                    self._file.write(data)
+                    self._file.flush()
+            except Exception as e:
+                logger.error(f"Query log write failed: {e}")
+            if stop:
+                self._file.close()
+                return
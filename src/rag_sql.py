@@ -1,42 +1,213 @@
+import itertools
 import logging
-from sentence_transformers import SentenceTransformer
-import faiss
+import time
 import json
+import os
+import uuid
 from src.model import SQLCoderAgent
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text
-from src.db_models import engine
+from src.db_models import engine as default_engine
+from src.embeddings import load_embedder
+from src.metrics import metrics
+from src.query_log import prompt_hash, trace_set, trace_stage
+from src.replicas import PRIMARY, ReplicaRouter
+from src.result_formats import describe_columns
+from src.sampling import rewrite_approximate, scan_rows
+from src.sql_postprocess import SQLPostProcessor
+from src.schema_context import DEFAULT_TOKENIZER, TYPE_MAPPING, SchemaContextBuilder, load_token_counter
+from src.schema_index import SchemaIndex
+from src.schema_introspection import SchemaWatcher, introspect_schema, merge_schema, schema_signature
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+PROMPT_TEMPLATE = (
+    "### Task:\n"
+    "Convert the question into a SQL query using the provided Postgres schema.\n\n"
+    "### Rules:\n"
+    "- Use table aliases to prevent ambiguity\n"
+    "- Use exact table names from schema (lowercase, singular form)\n"
+    "- Study the schema examples carefully for correct JOIN patterns\n\n"
+    "### Schema:\n"
+    "{schema_context}\n\n"
+    "### Question:\n"
+    "{query}\n\n"
+    "### SQL:\n"
+    "```sql\n"
+)
+
+
+def load_categories(path: str) -> set:
+    """Category names from a test_queries.json-style file; empty if it's missing."""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, 'r') as f:
+        return {cat['category'] for cat in json.load(f).get('test_queries', [])}
+
 
 class RAGSQL:
     def __init__(self,
                  schema_file: str = 'data/db.json',
-                 embedding_model: str ="all-MiniLM-L6-v2"
+                 embedding_model: str ="all-MiniLM-L6-v2",
+                 embedding_backend: str = "sentence-transformers",
+                 onnx_model_dir: str = "models/all-MiniLM-L6-v2-int8",
+                 embedding_threads: int = 1,
+                 query_cache_size: int = 1024,
+                 max_repairs: int = 0,
+                 repair_budget_s: float = 60.0,
+                 ann_threshold: int = 20000,
+                 lexical_weight: float = 0.3,
+                 fk_expansion: int = 2,
+                 live_schema: bool = False,
+                 schema_poll_s: float = 30.0,
+                 prompt_token_budget: int = 1024,
+                 tokenizer: str = DEFAULT_TOKENIZER,
+                 tokenizer_download: bool = False,
+                 replica_urls: list = None,
+                 max_replica_lag_s: float = 10.0,
+                 approx_tables: tuple = ("submission", "evaluation"),
+                 approx_percent: float = 5.0,
+                 approx_min_rows: int = 1_000_000,
+                 approx_method: str = "SYSTEM",
+                 categories_file: str = 'test_queries.json',
+                 engine=None,
+                 embedder=None,
+                 sql_agent: SQLCoderAgent = None
                  ):
-        # load schema
-        with open(schema_file, 'r') as f:
-            self.schema = json.load(f)
-
-        self.descriptions = []
-        for item in self.schema:
-            desc = (
-                f"Table: {item['table']}\n"
-                f"{item['description']}\n"
-                f"Columns: {', '.join(item['attributes'])}"
-            )
-            self.descriptions.append(desc)
-
-        # initialize emedding model and FAISS idx
-        self.embedding_model = SentenceTransformer(embedding_model)
-        self.embeddings = self.embedding_model.encode(self.descriptions)
-        self.index = faiss.IndexFlatL2(self.embeddings.shape[1])
-        self.index.add(self.embeddings)  # type: ignore
-
-        self.sql_agent = SQLCoderAgent()
-        self.Session = sessionmaker(bind=engine)
+        # engine/embedder/sql_agent can be injected so several tenants share
+        # one embedding model and one Ollama client
+        self.engine = engine if engine is not None else default_engine
+
+        # load curated schema descriptions (optional in live mode)
+        self.curated_schema = []
+        if schema_file:
+            with open(schema_file, 'r') as f:
+                self.curated_schema = json.load(f)
+
+        # live mode: structure comes from the database, descriptions from db.json
+        schema = self.curated_schema
+        signature = None
+        if live_schema:
+            signature = schema_signature(self.engine)
+            schema = merge_schema(introspect_schema(self.engine), self.curated_schema)
+
+        # initialize emedding model and table/column index (dense + BM25 + FK graph)
+        # backend: "sentence-transformers" (torch) or "onnx" (int8 onnxruntime)
+        self.embedding_model = embedder or load_embedder(
+            embedding_backend,
+            model_name=embedding_model,
+            onnx_model_dir=onnx_model_dir,
+            num_threads=embedding_threads,
+            query_cache_size=query_cache_size,
+        )
+        self.schema_index = SchemaIndex(
+            schema,
+            encode=self.embedding_model.encode,
+            ann_threshold=ann_threshold,
+            lexical_weight=lexical_weight,
+        )
+        self.fk_expansion = fk_expansion
+
+        # schema context assembled to fit prompt_token_budget (counted with the
+        # generation model's tokenizer: a tokenizer.json path, or a hub repo id, fetched only
+        # with tokenizer_download); None keeps the full descriptions + DDL
+        self.prompt_token_budget = prompt_token_budget
+        self.token_counter = load_token_counter(tokenizer, tokenizer_download)
+        self.context_builder = SchemaContextBuilder(self.token_counter)
+
+        self.schema_watcher = None
+        if live_schema:
+            self.schema_watcher = SchemaWatcher(self.engine, self.curated_schema, self.schema_index.update,
+                                                interval_s=schema_poll_s, signature=signature)
+            self.schema_watcher.start()
+
+        self.sql_agent = sql_agent or SQLCoderAgent()
+        # model output fixups (table renames) follow this tenant's schema, see postprocessor
+        self._postprocessor = None
+        self._postprocessor_schema = None
+        # self-repair: how many times a failing SQL is sent back to the model
+        # with the DB error, and the wall-clock budget for the whole loop
+        self.max_repairs = max_repairs
+        self.repair_budget_s = repair_budget_s
+        self.Session = sessionmaker(bind=self.engine)
+
+        # reads are balanced over healthy replicas within max_replica_lag_s, else the primary
+        self.router = ReplicaRouter(self.engine, replica_urls or [], max_lag_s=max_replica_lag_s)
+        if self.router.replicas:
+            self.router.start()
+        # approximate mode: these tables, plus (live schema) any table whose row estimate is
+        # >= approx_min_rows, are scanned as an approx_percent% TABLESAMPLE - but only when
+        # EXPLAIN estimates the query reads >= approx_min_rows rows of it
+        self.approx_tables = approx_tables
+        self.approx_percent = approx_percent
+        self.approx_min_rows = approx_min_rows
+        # SYSTEM samples pages (fast); BERNOULLI samples rows (slower, matches relative_error_95)
+        self.approx_method = approx_method
+        # known question categories; anything else is counted under "other"
+        self.categories = load_categories(categories_file)
+
+    def close(self):
+        """Stop background threads and close this instance's pooled connections."""
+        if self.schema_watcher:
+            self.schema_watcher.stop()
+        if self.router.replicas:
+            self.router.stop()
+        self.router.dispose()
+        self.engine.dispose()
+
+    def warmup_retrieval(self, query: str = "how many users submitted to the competition"):
+        """Run one uncached encode + index search so the first request doesn't pay for it."""
+        query_embedding = self.embedding_model.encode([query])[0]
+        self.schema_index.search(query, top_k=5, query_embedding=query_embedding)
+
+    def warmup_pool(self, connections: int = None) -> int:
+        """
+        Open `connections` (default: the pool size) connections at once and
+        return them to the pool, so they are established before traffic.
+        Replica pools are warmed too; an unreachable replica is only logged,
+        since reads fall back to the primary.
+        """
+        opened = self._warm_engine(self.engine, connections)
+        for replica in self.router.replicas:
+            try:
+                opened += self._warm_engine(replica.engine, connections)
+            except Exception as e:
+                logger.warning(f"Could not warm up replica {replica.name}: {e}")
+        return opened
+
+    @staticmethod
+    def _warm_engine(engine, connections: int = None) -> int:
+        if connections is None:
+            size = getattr(engine.pool, "size", None)
+            connections = size() if callable(size) else 1
+        opened = []
+        try:
+            for _ in range(connections):
+                conn = engine.connect()
+                opened.append(conn)
+                conn.execute(text("SELECT 1"))
+        finally:
+            for conn in opened:
+                conn.close()
+        return len(opened)
+
+    @property
+    def schema(self) -> list:
+        return self.schema_index.schema
+
+    @property
+    def descriptions(self) -> list:
+        return self.schema_index.descriptions
+
+    @property
+    def postprocessor(self) -> SQLPostProcessor:
+        """Post-processor with rename rules from the current schema; rebuilt when the schema is replaced."""
+        schema = self.schema
+        if self._postprocessor_schema is not schema:
+            self._postprocessor = SQLPostProcessor.for_schema(schema)
+            self._postprocessor_schema = schema
+        return self._postprocessor
 
     def _enrich_retrieved_tables(self, query_lower: str, retrieved: list) -> list:
         """
@@ -87,98 +258,217 @@ class RAGSQL:
         if table and table not in retrieved and table not in forced_tables:
             forced_tables.append(table)
 
+    def _describe(self, hits: list) -> list:
+        """Map [(table, score)] to table descriptions, skipping tables dropped meanwhile."""
+        by_table = self.schema_index.description_by_table
+        return [by_table[table] for table, _ in hits if table in by_table]
+
     def retrieve_schema(self, query, top_k: int=5):
-        query_embeddings = self.embedding_model.encode([query])
-        _, indices = self.index.search(query_embeddings, k=top_k)  # type: ignore
-        retrieved = [self.descriptions[i] for i in indices[0]]
+        query_embedding = self.embedding_model.encode_query(query)
+        hits = self.schema_index.search(query, top_k=top_k, query_embedding=query_embedding)
+        retrieved = self._describe(hits)
 
         # Enrich with keyword-based forced tables
         query_lower = query.lower()
         forced_tables = self._enrich_retrieved_tables(query_lower, retrieved)
 
-        all_tables = retrieved + forced_tables
+        # then tables reachable over foreign keys (join paths)
+        expanded = self._describe(self.schema_index.expand(hits, self.fk_expansion))
+        expanded = [t for t in expanded if t not in forced_tables]
+
+        all_tables = retrieved + forced_tables + expanded
         return all_tables[:top_k + 2]
 
-    def generate_sql(self, query: str, top_k: int=5):
-        retrieved = self.retrieve_schema(query, top_k)
+    def build_prompt(self, query: str, top_k: int=5) -> str:
+        with trace_stage("retrieve"):
+            retrieved = self.retrieve_schema(query, top_k)
         logger.info(f"Retrieved {len(retrieved)} tables for query: {query}")
 
         retrieved_tables = [desc.split('\n')[0].replace('Table: ', '').strip() for desc in retrieved]
         logger.info(f"Tables: {', '.join(retrieved_tables)}")
 
-        type_mapping = {
-            'id': 'INTEGER PRIMARY KEY',
-            'user_id': 'INTEGER',
-            'competition_id': 'INTEGER',
-            'participation_id': 'INTEGER',
-            'task_type_id': 'INTEGER',
-            'metric_id': 'INTEGER',
-            'dataset_id': 'INTEGER',
-            'submission_id': 'INTEGER',
-            'evaluation_id': 'INTEGER',
-            'organizer_id': 'INTEGER',
-            'config_id': 'INTEGER',
-            'prize_id': 'INTEGER',
-            'file_id': 'INTEGER',
-            'kernel_id': 'INTEGER',
-            'row_id': 'INTEGER',
-            'best_evaluation_id': 'INTEGER',
-            'created_at': 'TIMESTAMP',
-            'submitted_at': 'TIMESTAMP',
-            'registered_at': 'TIMESTAMP',
-            'computed_at': 'TIMESTAMP',
-            'updated_at': 'TIMESTAMP',
-            'start_at': 'TIMESTAMP',
-            'end_at': 'TIMESTAMP',
-            'amount': 'NUMERIC',
-            'metric_value': 'NUMERIC',
-            'score': 'NUMERIC',
-            'size_bytes': 'BIGINT',
-            'rank': 'INTEGER',
-            'rank_position': 'INTEGER',
-            'max_daily_submissions': 'INTEGER',
-            'is_hidden': 'BOOLEAN',
-            'is_valid': 'BOOLEAN'
-        }
+        with trace_stage("build_prompt"):
+            if self.prompt_token_budget is None:
+                schema_context = self._full_schema_context(retrieved, retrieved_tables)
+            else:
+                # the budget covers the whole prompt; the schema gets what the template leaves
+                overhead = self.token_counter.count(PROMPT_TEMPLATE.format(schema_context="", query=query))
+                column_scores = self.schema_index.column_scores(
+                    query, retrieved_tables, query_embedding=self.embedding_model.encode_query(query))
+                schema_context = self.context_builder.build(
+                    self.schema, retrieved_tables, column_scores, self.prompt_token_budget - overhead)
+
+            prompt = PROMPT_TEMPLATE.format(schema_context=schema_context, query=query)
+            prompt_tokens = self.token_counter.count(prompt)
+
+        metrics.observe("prompt_tokens_estimated", prompt_tokens)
+        trace_set(retrieved_tables=[t.strip('"') for t in retrieved_tables], prompt_hash=prompt_hash(prompt),
+                  prompt_tokens_estimated=prompt_tokens)
+        logger.info(f"Prompt length: {len(prompt)} characters, ~{prompt_tokens} tokens")
+        logger.debug(f"Full prompt:\n{prompt}")
+        return prompt
 
+    def _full_schema_context(self, retrieved: list, retrieved_tables: list) -> str:
+        """Unbudgeted context: full descriptions followed by DDL of all retrieved tables."""
         create_statements = []
         for item in self.schema:
             if item['table'] in retrieved_tables:
                 col_defs = []
+                column_types = item.get('column_types', {})
                 for col in item['attributes']:
-                    col_type = type_mapping.get(col, 'TEXT')
+                    col_type = column_types.get(col) or TYPE_MAPPING.get(col, 'TEXT')
                     col_defs.append(f"{col} {col_type}")
 
                 cols_str = ', '.join(col_defs)
                 create_statements.append(f"CREATE TABLE {item['table']} ({cols_str});")
 
-        schema_context = "\n\n".join(retrieved) + "\n\n" + "\n".join(create_statements)
-
-        prompt = (
-            f"### Task:\n"
-            f"Convert the question into a SQL query using the provided Postgres schema.\n\n"
-            f"### Rules:\n"
-            f"- Use table aliases to prevent ambiguity\n"
-            f"- Use exact table names from schema (lowercase, singular form)\n"
-            f"- Study the schema examples carefully for correct JOIN patterns\n\n"
-            f"### Schema:\n"
-            f"{schema_context}\n\n"
-            f"### Question:\n"
-            f"{query}\n\n"
-            f"### SQL:\n"
+        return "\n\n".join(retrieved) + "\n\n" + "\n".join(create_statements)
+
+    def generate_sql(self, query: str, top_k: int=5):
+        prompt = self.build_prompt(query, top_k)
+        return self.sql_agent.generate_response(prompt, postprocessor=self.postprocessor)
+
+    @staticmethod
+    def _short_error(error: Exception) -> str:
+        """Strip SQLAlchemy's echoed statement and background link from a DB error."""
+        message = str(error).split('[SQL:')[0]
+        message = message.replace('SQL execution error:', '').strip()
+        return '\n'.join(line for line in message.splitlines() if line.strip())
+
+    @staticmethod
+    def _build_repair_prompt(prompt: str, failed_sql: str, error: str) -> str:
+        """
+        Extend the previous prompt with the failed SQL and the error.
+        The result starts with the exact previous prompt, so Ollama reuses the
+        already-evaluated prefix (schema context) instead of re-reading it.
+        """
+        return (
+            f"{prompt}{failed_sql}\n```\n\n"
+            f"### Error:\n"
+            f"{error}\n\n"
+            f"### Corrected SQL:\n"
             f"```sql\n"
         )
 
-        logger.info(f"Prompt length: {len(prompt)} characters")
-        logger.debug(f"Full prompt:\n{prompt}")
-
-        return self.sql_agent.generate_response(prompt)
+    def approximate_sql(self, sql_query: str, limit: int = 3) -> tuple:
+        """
+        Validated SQL rewritten to sample the large tables (see src/sampling.py).
+        Returns (sql, approximation info or None when no large table is scanned,
+        or EXPLAIN estimates fewer than approx_min_rows rows read from it).
+        """
+        sql_query = self._prepare_select(sql_query, limit)
+        sampled, info = rewrite_approximate(sql_query, self.large_tables(), self.approx_percent, self.approx_method)
+        if info is None:
+            return sql_query, None
+        # a selective query (an index lookup) is faster exact, and a sample of it is mostly empty
+        rows = self._estimated_scan_rows(sql_query, info["sampled_table"])
+        if rows is None or rows < self.approx_min_rows:
+            logger.info(f"Running exactly: ~{rows} rows estimated from {info['sampled_table']}")
+            return sql_query, None
+        info["estimated_rows"] = int(rows)
+        return sampled, info
+
+    def _estimated_scan_rows(self, sql_query: str, table: str):
+        """Planner's row estimate for the scan of `table` in the query; None if EXPLAIN fails."""
+        try:
+            with self.router.reader() as (_, engine):
+                with engine.connect() as conn:
+                    plan = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql_query}")).scalar()
+        except Exception as e:
+            logger.warning(f"EXPLAIN failed: {self._short_error(e)}")
+            return None
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return scan_rows(plan[0]["Plan"], table)
+
+    def large_tables(self) -> set:
+        """approx_tables plus tables estimated at approx_min_rows rows or more (live schema only)."""
+        tables = {t.strip('"') for t in self.approx_tables}
+        for item in self.schema:
+            if (item.get('row_estimate') or 0) >= self.approx_min_rows:
+                tables.add(item['table'].strip('"'))
+        return tables
 
-    def execute_sql(self, sql_query: str, limit: int = 3):
+    def _execute(self, sql: str, limit: int, stream: bool, batch_size: int, approximate: bool = False):
         """
-        Execute SQL query with safety checks and result limiting.
-        Only allows SELECT queries.
+        Returns (result, approximation info or None). If the sampled rewrite
+        fails, the query is run exactly, so any error left for repair belongs
+        to the SQL the model wrote.
+        """
+        if approximate:
+            sampled, approximation = self.approximate_sql(sql, limit)
+            if approximation is not None:
+                try:
+                    return self._run(sampled, limit, stream, batch_size), approximation
+                except ValueError as e:
+                    logger.warning(f"Approximate query failed, running it exactly: {self._short_error(e)}")
+                    metrics.increment("approximate_fallbacks")
+        return self._run(sql, limit, stream, batch_size), None
+
+    def _run(self, sql: str, limit: int, stream: bool, batch_size: int):
+        if not stream:
+            return self.execute_sql(sql, limit)
+        batches = self.stream_sql(sql, limit, batch_size)
+        first = next(batches)  # runs the query, so errors surface here (and can be repaired)
+        return itertools.chain([first], batches)
+
+    def _metric_category(self, category: str) -> str:
+        """Client-supplied category as a metrics label, limited to the known set."""
+        if not category:
+            return 'uncategorized'
+        return category if category in self.categories else 'other'
+
+    def generate_and_execute(self, query: str, limit: int = 3, top_k: int = 5,
+                             category: str = None, stream: bool = False,
+                             batch_size: int = 10_000, approximate: bool = False) -> dict:
+        """
+        Generate SQL and execute it. When max_repairs > 0, a failing query is
+        sent back to the model together with the validator/Postgres error,
+        bounded by max_repairs and repair_budget_s.
+        Returns dict with sql, result, number of attempts and prompt tokens
+        evaluated over all attempts (as reported by Ollama); with stream=True
+        result is an iterator of (columns, rows) batches from stream_sql.
+        With approximate=True, large tables are sampled and 'approximation'
+        describes the sample (None when the query was run exactly).
         """
+        category = self._metric_category(category)
+        deadline = time.monotonic() + self.repair_budget_s
+
+        prompt = self.build_prompt(query, top_k)
+        response = self.sql_agent.generate_response(prompt, postprocessor=self.postprocessor)
+        attempts = 1
+        prompt_tokens = response.get("prompt_tokens") or 0
+
+        while True:
+            sql = response.get("processed", "")
+            if not response.get("raw"):
+                # model unreachable or empty output - nothing to repair
+                metrics.increment("sql_attempts", {"category": category, "outcome": "failed", "attempts": attempts})
+                raise ValueError(sql or "Empty response from model")
+
+            try:
+                with trace_stage("execute"):
+                    result, approximation = self._execute(sql, limit, stream, batch_size, approximate)
+                metrics.increment("sql_attempts", {"category": category, "outcome": "success", "attempts": attempts})
+                return {"sql": sql, "result": result, "attempts": attempts, "prompt_tokens": prompt_tokens,
+                        "approximation": approximation}
+            except ValueError as e:
+                remaining = deadline - time.monotonic()
+                if attempts > self.max_repairs or remaining <= 0:
+                    metrics.increment("sql_attempts", {"category": category, "outcome": "failed", "attempts": attempts})
+                    raise
+
+                error = self._short_error(e)
+                logger.info(f"Repair attempt {attempts}/{self.max_repairs} after error: {error}")
+                prompt = self._build_repair_prompt(prompt, sql, error)
+                response = self.sql_agent.generate_response(prompt, timeout=remaining,
+                                                           postprocessor=self.postprocessor)
+                attempts += 1
+                prompt_tokens += response.get("prompt_tokens") or 0
+
+    @staticmethod
+    def _prepare_select(sql_query: str, limit: int) -> str:
+        """Validate that the query is a SELECT and add a LIMIT if it has none."""
         sql_query = sql_query.rstrip(';').strip()
         sql_upper = sql_query.upper()
         if not sql_upper.startswith("SELECT"):
@@ -186,18 +476,74 @@ class RAGSQL:
 
         if "LIMIT" not in sql_upper:
             sql_query += f" LIMIT {limit}"
+        return sql_query
+
+    def execute_sql(self, sql_query: str, limit: int = 3):
+        """
+        Execute SQL query with safety checks and result limiting.
+        Only allows SELECT queries.
+        """
+        sql_query = self._prepare_select(sql_query, limit)
 
         try:
-            session = self.Session()
-            result = session.execute(text(sql_query))
-            rows = result.fetchall()
-            columns = result.keys()
-            session.close()
+            with self.router.reader() as (_, engine):
+                session = self.Session(bind=engine)
+                result = session.execute(text(sql_query))
+                rows = result.fetchall()
+                columns = result.keys()
+                session.close()
             return {"columns": list(columns), "rows": [list(row) for row in rows]}
         except Exception as e:
             logger.error(f"Error executing SQL: {e}")
             raise ValueError(f"SQL execution error: {str(e)}")
 
+    def stream_sql(self, sql_query: str, limit: int = 1_000_000, batch_size: int = 10_000,
+                   on_connect=None):
+        """
+        Execute a SELECT on a server-side (named) DBAPI cursor, yielding
+        (columns, rows) with rows as the driver's tuples, batch_size at a time.
+        Runs on a replica when one is eligible (see ReplicaRouter).
+        on_connect(backend_pid, server) is called before the query starts, so
+        the caller can cancel_backend() it. The query runs on the first next().
+        """
+        sql_query = self._prepare_select(sql_query, limit)
+
+        with self.router.reader() as (server, engine):
+            yield from self._stream(engine, server, sql_query, batch_size, on_connect)
+
+    @staticmethod
+    def _stream(engine, server: str, sql_query: str, batch_size: int, on_connect):
+        raw = engine.raw_connection()
+        try:
+            if on_connect:
+                cur = raw.cursor()
+                cur.execute("SELECT pg_backend_pid()")
+                on_connect(cur.fetchone()[0], server)
+                cur.close()
+
+            cur = raw.cursor(name=f"sqlrag_{uuid.uuid4().hex[:12]}")
+            cur.execute(sql_query)
+            batch = cur.fetchmany(batch_size)
+            # named cursors only know their description after the first fetch
+            columns = describe_columns(cur.description)
+            yield columns, batch
+            while batch:
+                batch = cur.fetchmany(batch_size)
+                if batch:
+                    yield columns, batch
+            cur.close()
+            raw.rollback()
+        except Exception as e:
+            logger.error(f"Error executing SQL: {e}")
+            raise ValueError(f"SQL execution error: {str(e)}")
+        finally:
+            raw.close()
+
+    def cancel_backend(self, backend_pid: int, server: str = PRIMARY) -> bool:
+        """Cancel the statement running on a Postgres backend (pg_cancel_backend) of `server`."""
+        with self.router.engine_for(server).connect() as conn:
+            return bool(conn.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": backend_pid}).scalar())
+
 
 if __name__ == "__main__":
     test_queries = [
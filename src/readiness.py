@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict
+
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PENDING, OK, FAILED = "pending", "ok", "failed"
+
+
+class Readiness:
+    """
+    Runs warmup steps (component name -> callable) in background threads and
+    tracks their status for the readiness probe. A failing step is retried
+    every retry_s, so the service becomes ready once e.g. Ollama comes up.
+    A step may return a dict of details to report next to its timing.
+    Components with a check (name -> callable raising when the component is
+    no longer warm, e.g. the model was unloaded) are re-checked every
+    check_interval_s after warmup; a failed check marks the component failed
+    and runs its warmup step again.
+    """
+
+    def __init__(self, steps: Dict[str, Callable], retry_s: float = 10.0,
+                 checks: Dict[str, Callable] = None, check_interval_s: float = 30.0):
+        self.steps = steps
+        self.retry_s = retry_s
+        self.checks = checks or {}
+        self.check_interval_s = check_interval_s
+        self._lock = threading.Lock()
+        self._components = {name: {"status": PENDING, "attempts": 0} for name in steps}
+        self._threads = []
+        self._stop = threading.Event()
+
+    def start(self):
+        if self._threads:
+            return
+        for name, step in self.steps.items():
+            thread = threading.Thread(target=self._run, args=(name, step), name=f"warmup-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, name: str, step: Callable):
+        while not self._stop.is_set():
+            self._warm(name, step)
+            check = self.checks.get(name)
+            if check is None:
+                return
+            while not self._stop.wait(self.check_interval_s):
+                try:
+                    check()
+                except Exception as e:
+                    with self._lock:
+                        self._components[name].update(status=FAILED, error=str(e))
+                    metrics.increment("readiness_lost", {"component": name})
+                    logger.warning(f"Component '{name}' is no longer warm, warming up again: {e}")
+                    break
+
+    def _warm(self, name: str, step: Callable):
+        """Run the step until it succeeds (or stop())."""
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            try:
+                details = step() or {}
+                error = None
+            except Exception as e:
+                details, error = {}, str(e)
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                component = self._components[name]
+                component["attempts"] += 1
+                component["warmup_s"] = round(elapsed, 3)
+                component.update(details)
+                if error is None:
+                    component["status"] = OK
+                    component.pop("error", None)
+                else:
+                    component["status"] = FAILED
+                    component["error"] = error
+
+            if error is None:
+                metrics.observe("warmup_s", elapsed, {"component": name})
+                logger.info(f"Warmup '{name}' done in {elapsed:.2f}s")
+                return
+            logger.warning(f"Warmup '{name}' failed, retrying in {self.retry_s}s: {error}")
+            self._stop.wait(self.retry_s)
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            return all(c["status"] == OK for c in self._components.values())
+
+    def status(self) -> dict:
+        with self._lock:
+            components = {name: dict(c) for name, c in self._components.items()}
+        return {"ready": all(c["status"] == OK for c in components.values()), "components": components}
@@ -0,0 +1,133 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import List
+
+from sqlalchemy import text
+
+from src.db_models import create_db_engine
+from src.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIMARY = "primary"
+
+# seconds behind the primary; 0 when caught up (an idle primary doesn't advance
+# pg_last_xact_replay_timestamp) and on a server that isn't a standby
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+class _Replica:
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self.healthy = False  # until the first probe succeeds
+        self.lag_s = None
+        self.error = None
+        self.in_flight = 0
+        self.checked_at = None
+
+
+class ReplicaRouter:
+    """
+    Routes read-only queries across read replicas. A background thread probes
+    every replica each check_interval_s (connectivity + replay lag); a read goes
+    to the healthy replica within max_lag_s with the fewest queries in flight,
+    or to the primary when no replica qualifies.
+    Servers are named "primary", "replica0", "replica1", ... in config order.
+    """
+
+    def __init__(self, primary, replica_urls: List[str], max_lag_s: float = 10.0,
+                 check_interval_s: float = 5.0, engine_kwargs: dict = None):
+        self.primary = primary
+        self.max_lag_s = max_lag_s
+        self.check_interval_s = check_interval_s
+        self.replicas = [
+            _Replica(f"replica{i}", create_db_engine(url, pool_pre_ping=True, **(engine_kwargs or {})))
+            for i, url in enumerate(replica_urls)
+        ]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="replica-health", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.check_interval_s)
+
+    def dispose(self):
+        for replica in self.replicas:
+            replica.engine.dispose()
+
+    def _probe(self, replica: _Replica):
+        try:
+            with replica.engine.connect() as conn:
+                lag_s = float(conn.execute(text(REPLICA_LAG_SQL)).scalar())
+            healthy, error = True, None
+        except Exception as e:
+            lag_s, healthy, error = None, False, str(e).splitlines()[0]
+        with self._lock:
+            if replica.healthy and not healthy:
+                logger.warning(f"Replica {replica.name} is down: {error}")
+            elif healthy and not replica.healthy:
+                logger.info(f"Replica {replica.name} is up (lag {lag_s:.1f}s)")
+            replica.healthy, replica.lag_s, replica.error = healthy, lag_s, error
+            replica.checked_at = time.time()
+
+    def check(self):
+        """Probe all replicas once."""
+        for replica in self.replicas:
+            self._probe(replica)
+
+    def _run(self):
+        while True:
+            self.check()
+            if self._stop.wait(self.check_interval_s):
+                return
+
+    def _choose(self, max_lag_s: float):
+        eligible = [r for r in self.replicas if r.healthy and r.lag_s is not None and r.lag_s <= max_lag_s]
+        if not eligible:
+            return None
+        fewest = min(r.in_flight for r in eligible)
+        return random.choice([r for r in eligible if r.in_flight == fewest])
+
+    @contextmanager
+    def reader(self, max_lag_s: float = None):
+        """Yield (server name, engine) for one read; held for the whole query."""
+        with self._lock:
+            replica = self._choose(self.max_lag_s if max_lag_s is None else max_lag_s)
+            if replica:
+                replica.in_flight += 1
+        name = replica.name if replica else PRIMARY
+        metrics.increment("db_reads", {"server": name})
+        try:
+            yield name, replica.engine if replica else self.primary
+        finally:
+            if replica:
+                with self._lock:
+                    replica.in_flight -= 1
+
+    def engine_for(self, name: str):
+        for replica in self.replicas:
+            if replica.name == name:
+                return replica.engine
+        return self.primary
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                r.name: {"healthy": r.healthy, "lag_s": r.lag_s, "in_flight": r.in_flight,
+                         "error": r.error, "checked_at": r.checked_at}
+                for r in self.replicas
+            }
@@ -0,0 +1,279 @@
+"""
+Streaming encoders for query results.
+
+Every encoder takes the result as an iterator of (columns, rows) batches,
+rows being the DB driver's tuples (see RAGSQL.stream_sql), and yields bytes,
+so a response is produced batch by batch without per-row Python lists.
+DECIMAL values are kept exact: strings in JSON/CSV; in Arrow/Parquet
+decimal128 with the column's declared precision and scale, or strings for
+numeric without a declared scale (AVG(), computed expressions), since one
+batch's values can't fix a scale that later batches also fit. Other Arrow
+types come from the column's Postgres type too (an int column whose first
+batch is all NULL stays int); values are inspected only for other types.
+Dates and times are ISO-8601 in every text format.
+"""
+import csv
+import datetime
+import functools
+import io
+from decimal import Decimal
+from typing import Iterable, Iterator, List, Tuple
+
+import orjson
+
+Batches = Iterable[Tuple[List[str], list]]
+
+NUMERIC_OID = 1700
+_DATE_OIDS = {1082, 1083, 1114, 1184}  # date, time, timestamp, timestamptz
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.sqlrag.columnar+json"
+CSV = "text/csv"
+ARROW = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+
+
+class Column(str):
+    """A column name carrying its type from cursor.description (type_code, precision, scale)."""
+
+    def __new__(cls, name: str, type_code: int = None, precision: int = None, scale: int = None):
+        column = super().__new__(cls, name)
+        column.type_code, column.precision, column.scale = type_code, precision, scale
+        return column
+
+
+def describe_columns(description) -> List[Column]:
+    """Columns from a DBAPI cursor.description."""
+    return [Column(d[0], d[1], d[4], d[5]) for d in description]
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def _dumps(value) -> bytes:
+    return orjson.dumps(value, default=_default)
+
+
+def encode_json(batches: Batches, meta: dict) -> Iterator[bytes]:
+    """{...meta, "result": {"columns": [...], "rows": [[...], ...]}} - the /execute-sql shape."""
+    prefix = _dumps(meta)[:-1] + (b',' if meta else b'') + b'"result":{"columns":'
+    started = False
+    sep = b''
+    for columns, rows in batches:
+        if not started:
+            yield prefix + _dumps(columns) + b',"rows":['
+            started = True
+        if rows:
+            yield sep + _dumps(rows)[1:-1]
+            sep = b','
+    if not started:
+        yield prefix + b'[],"rows":['
+    yield b']}}'
+
+
+def encode_columnar_json(batches: Batches, meta: dict) -> Iterator[bytes]:
+    """{...meta, "columns": [...], "batches": [[col0 values, col1 values, ...], ...]}"""
+    head = _dumps(meta)[:-1]
+    started = False
+    sep = b''
+    for columns, rows in batches:
+        if not started:
+            yield head + (b',' if meta else b'') + b'"columns":' + _dumps(columns) + b',"batches":['
+            started = True
+        if rows:
+            yield sep + _dumps(list(zip(*rows)))
+            sep = b','
+    if not started:
+        yield head + (b',' if meta else b'') + b'"columns":[],"batches":['
+    yield b']}'
+
+
+_TEMPORAL = (datetime.date, datetime.time)  # datetime is a date
+
+
+def _iso_rows(columns: list, rows: list) -> list:
+    """Rows with date/time values as ISO-8601 (csv would write str(): '2024-01-01 10:00:00')."""
+    temporal = []
+    for i, values in enumerate(zip(*rows)):
+        first = next((v for v in values if v is not None), None)
+        if getattr(columns[i], 'type_code', None) in _DATE_OIDS or isinstance(first, _TEMPORAL):
+            temporal.append(i)
+    if not temporal:
+        return rows
+    converted = []
+    for row in rows:
+        row = list(row)
+        for i in temporal:
+            if row[i] is not None:
+                row[i] = row[i].isoformat()
+        converted.append(row)
+    return converted
+
+
+def encode_csv(batches: Batches, meta: dict) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    header = False
+    for columns, rows in batches:
+        if not header:
+            writer.writerow(columns)
+            header = True
+        writer.writerows(_iso_rows(columns, rows))
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+
+
+@functools.lru_cache(maxsize=None)
+def _oid_types() -> dict:
+    """Arrow types of the common Postgres type OIDs."""
+    import pyarrow as pa
+
+    return {
+        16: pa.bool_(),
+        20: pa.int64(), 21: pa.int16(), 23: pa.int32(),
+        700: pa.float32(), 701: pa.float64(),
+        25: pa.string(), 1042: pa.string(), 1043: pa.string(),
+        1082: pa.date32(), 1083: pa.time64('us'),
+        1114: pa.timestamp('us'), 1184: pa.timestamp('us', tz='UTC'),
+    }
+
+
+def _field_type(column: str, values: tuple):
+    """
+    Arrow type of a column: from its Postgres type (declared NUMERIC(p, s) as
+    decimal, common OIDs via _oid_types), else inferred from the first batch.
+    """
+    import pyarrow as pa
+
+    type_code = getattr(column, 'type_code', None)
+    if type_code == NUMERIC_OID:
+        precision, scale = column.precision, column.scale
+        if precision and scale is not None and 0 < precision <= 76:
+            return pa.decimal128(precision, scale) if precision <= 38 else pa.decimal256(precision, scale)
+        return pa.string()
+    known = _oid_types().get(type_code)
+    if known is not None:
+        return known
+    inferred = pa.array(values).type
+    if pa.types.is_null(inferred) or pa.types.is_decimal(inferred):
+        # decimals without a declared scale: later batches may need a larger one
+        return pa.string()
+    return inferred
+
+
+def _to_array(values: tuple, arrow_type):
+    import pyarrow as pa
+
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if pa.types.is_string(arrow_type):
+            return pa.array([None if v is None else str(v) for v in values], type=arrow_type)
+        return pa.array(values).cast(arrow_type)
+
+
+def _arrow_batches(batches: Batches):
+    """Yield (schema, RecordBatch); the schema is fixed by the column types and the first batch."""
+    import pyarrow as pa
+
+    schema = None
+    for columns, rows in batches:
+        values = list(zip(*rows)) if rows else [()] * len(columns)
+        if schema is None:
+            schema = pa.schema([pa.field(name, _field_type(name, col)) for name, col in zip(columns, values)])
+        arrays = [_to_array(col, field.type) for col, field in zip(values, schema)]
+        yield schema, pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def encode_arrow(batches: Batches, meta: dict) -> Iterator[bytes]:
+    import pyarrow as pa
+
+    sink = _ChunkSink()
+    writer = None
+    for schema, batch in _arrow_batches(batches):
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_batch(batch)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+
+def encode_parquet(batches: Batches, meta: dict) -> Iterator[bytes]:
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    for schema, batch in _arrow_batches(batches):
+        if writer is None:
+            writer = pq.ParquetWriter(sink, schema, compression='zstd')
+        writer.write_batch(batch)
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {
+    JSON: encode_json,
+    COLUMNAR_JSON: encode_columnar_json,
+    CSV: encode_csv,
+    ARROW: encode_arrow,
+    PARQUET: encode_parquet,
+}
+
+# ?format= shortcuts
+FORMAT_ALIASES = {
+    "json": JSON,
+    "columnar": COLUMNAR_JSON,
+    "csv": CSV,
+    "arrow": ARROW,
+    "parquet": PARQUET,
+}
+
+
+def negotiate(accept: str = None, fmt: str = None) -> str:
+    """
+    Pick a media type from an explicit ?format= or the Accept header
+    (first supported type wins; q-values are not ranked). Defaults to JSON.
+    """
+    if fmt:
+        if fmt not in FORMAT_ALIASES:
+            raise ValueError(f"Unsupported format: {fmt}. Use one of: {', '.join(FORMAT_ALIASES)}")
+        return FORMAT_ALIASES[fmt]
+    for part in (accept or '').split(','):
+        media_type = part.split(';')[0].strip().lower()
+        if media_type in ENCODERS:
+            return media_type
+    return JSON
@@ -0,0 +1,162 @@
+"""
+Approximate execution: rewrite a SELECT to scan a TABLESAMPLE of one of its
+large tables and scale the aggregates back up.
+
+Only queries with a COUNT/SUM/AVG aggregate are rewritten (MIN/MAX of a
+sample are biased inwards, so MIN/MAX-only queries are left exact), and only
+the first large table referenced at the top level (FROM/JOIN, not in
+subqueries) is sampled. Top-level COUNT()/SUM() are multiplied by
+100/percent; AVG/MIN/MAX are left as they are; window aggregates (OVER) are
+not touched. Whether the table is large for this query is the caller's call
+(scan_rows gives the planner's estimate from EXPLAIN). Two extra columns are added per result row: sample_rows
+(rows of the sample behind that row) and relative_error_95, an approximate 95%
+relative error of the scaled counts, 1.96 * sqrt((1 - f) / sample_rows).
+That bound assumes row-level sampling, which BERNOULLI is; SYSTEM samples
+whole pages and is faster, but on tables clustered by the grouped or filtered
+columns its actual error can be larger. The info dict says which applies.
+"""
+import re
+from typing import Iterable, Optional, Tuple
+
+_TOKEN = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|\w+|\S")
+
+_CLAUSE_KEYWORDS = {
+    'ON', 'USING', 'WHERE', 'JOIN', 'INNER', 'LEFT', 'RIGHT', 'FULL', 'CROSS', 'NATURAL',
+    'GROUP', 'ORDER', 'HAVING', 'LIMIT', 'OFFSET', 'FETCH', 'WINDOW', 'UNION', 'INTERSECT',
+    'EXCEPT', 'TABLESAMPLE', 'LATERAL',
+}
+_AGGREGATES = {'COUNT', 'SUM', 'AVG', 'MIN', 'MAX'}
+_SCALED = {'COUNT', 'SUM'}
+_ESTIMATED = {'COUNT', 'SUM', 'AVG'}  # aggregates a sample estimates
+
+
+def _tokens(sql: str) -> list:
+    """(start, end, text, paren depth) for each token; string literals are single tokens."""
+    depth = 0
+    tokens = []
+    for m in _TOKEN.finditer(sql):
+        tok = m.group()
+        if tok == ')':
+            depth -= 1
+        tokens.append((m.start(), m.end(), tok, depth))
+        if tok == '(':
+            depth += 1
+    return tokens
+
+
+def _closing(tokens: list, open_idx: int) -> int:
+    depth = tokens[open_idx][3]
+    for j in range(open_idx + 1, len(tokens)):
+        if tokens[j][2] == ')' and tokens[j][3] == depth:
+            return j
+    return len(tokens) - 1
+
+
+def _sample_target(tokens: list, tables: set) -> Optional[Tuple[int, str]]:
+    """(insert position after the table reference and its alias, table) of the first sampled table."""
+    for i, (_, _, tok, depth) in enumerate(tokens):
+        if depth != 0 or tok.upper() not in ('FROM', 'JOIN') or i + 1 >= len(tokens):
+            continue
+        j = i + 1
+        if j + 2 < len(tokens) and tokens[j + 1][2] == '.':  # schema-qualified
+            j += 2
+        name = tokens[j][2].strip('"').lower()
+        if name not in tables:
+            continue
+        end = tokens[j][1]
+        k = j + 1
+        if k < len(tokens) and tokens[k][2].upper() == 'AS':
+            k += 1
+        if k < len(tokens) and re.match(r'\w+$|"', tokens[k][2]) and tokens[k][2].upper() not in _CLAUSE_KEYWORDS:
+            end = tokens[k][1]
+            k += 1
+        if k < len(tokens) and tokens[k][2].upper() == 'TABLESAMPLE':
+            return None  # already sampled
+        return end, name
+    return None
+
+
+def scan_rows(plan: dict, table: str) -> Optional[float]:
+    """
+    Planner's estimate of the rows read from `table` (largest "Plan Rows" of a
+    scan on it) in an EXPLAIN (FORMAT JSON) plan node; None if it isn't scanned.
+    """
+    rows = plan.get("Plan Rows") if plan.get("Relation Name", "").lower() == table.lower() else None
+    for child in plan.get("Plans", []):
+        child_rows = scan_rows(child, table)
+        if child_rows is not None and (rows is None or child_rows > rows):
+            rows = child_rows
+    return rows
+
+
+def rewrite_approximate(sql: str, tables: Iterable[str], percent: float,
+                        method: str = 'SYSTEM') -> Tuple[str, Optional[dict]]:
+    """
+    Return (sql, info). info is None when nothing was rewritten (no
+    COUNT/SUM/AVG, no sampled table at the top level, or a set operation).
+    method: 'SYSTEM' (page sampling) or 'BERNOULLI' (row sampling).
+    """
+    method = method.upper()
+    if method not in ('SYSTEM', 'BERNOULLI'):
+        raise ValueError(f"Unsupported sampling method: {method}")
+    tokens = _tokens(sql)
+    top_level = [t[2].upper() for t in tokens if t[3] == 0]
+    if any(kw in top_level for kw in ('UNION', 'INTERSECT', 'EXCEPT')):
+        return sql, None
+    target = _sample_target(tokens, {t.strip('"').lower() for t in tables})
+    if target is None:
+        return sql, None
+    sample_pos, table = target
+
+    fraction = percent / 100.0
+    scale = round(1 / fraction, 6)
+    edits = [(sample_pos, sample_pos, f" TABLESAMPLE {method} ({percent:g})")]
+
+    from_idx = next((i for i, t in enumerate(tokens) if t[3] == 0 and t[2].upper() == 'FROM'), None)
+    aggregate = False
+    unscaled = []
+    for i, (start, _, tok, depth) in enumerate(tokens):
+        name = tok.upper()
+        if depth != 0 or name not in _AGGREGATES or i + 1 >= len(tokens) or tokens[i + 1][2] != '(':
+            continue
+        close = _closing(tokens, i + 1)
+        if close + 1 < len(tokens) and tokens[close + 1][2].upper() == 'OVER':
+            continue  # window aggregate: per-row, over the sample
+        if from_idx is not None and i < from_idx and name in _ESTIMATED:
+            aggregate = True
+        if name not in _SCALED:
+            continue
+        if i + 2 < len(tokens) and tokens[i + 2][2].upper() == 'DISTINCT':
+            unscaled.append(sql[start:tokens[close][1]])  # distinct counts don't scale linearly
+            continue
+        suffix = f" * {scale:g})"
+        following = tokens[close + 1][2].upper() if close + 1 < len(tokens) else ''
+        if i < (from_idx or 0) and following in (',', 'FROM'):
+            suffix += f" AS {name.lower()}"  # keep Postgres' default column name
+        edits.append((start, start, "("))
+        edits.append((tokens[close][1], tokens[close][1], suffix))
+
+    if not aggregate or from_idx is None:
+        return sql, None  # a sample of plain rows isn't an approximation of anything
+
+    pos = tokens[from_idx][0]
+    edits.append((pos, pos, f", COUNT(*) AS sample_rows, "
+                            f"round((1.96 * sqrt((1 - {fraction:g}) / NULLIF(COUNT(*), 0)))::numeric, 4) "
+                            f"AS relative_error_95 "))
+
+    rewritten = sql
+    for start, end, insert in sorted(edits, key=lambda e: e[0], reverse=True):
+        rewritten = rewritten[:start] + insert + rewritten[end:]
+
+    info = {
+        "sampled_table": table,
+        "sample_percent": percent,
+        "method": method,
+        "scale": scale,
+        "error_columns": aggregate,
+        # relative_error_95 assumes row sampling; exact for BERNOULLI, optimistic for SYSTEM on clustered data
+        "error_model": "row sampling" if method == 'BERNOULLI' else "row sampling (approximate: SYSTEM samples pages)",
+        "unscaled": unscaled,
+        "sql": rewritten,
+    }
+    return rewritten, info
@@ -0,0 +1,228 @@
+import json
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from pydantic import BaseModel
+
+from src.metrics import metrics
+
+
+class SchedulerConfig(BaseModel):
+    max_concurrent: int = 1
+    max_queue: int = 32
+    max_queue_per_client: int = 4
+    initial_estimate_s: float = 10.0
+    # background jobs wait for a generation slot up to this long
+    job_deadline_s: float = 3600.0
+
+
+def load_scheduler_config(path: str = 'data/scheduler.json') -> SchedulerConfig:
+    """Admission control limits; defaults when the file is missing."""
+    if not os.path.exists(path):
+        return SchedulerConfig()
+    with open(path, 'r') as f:
+        return SchedulerConfig(**json.load(f))
+
+
+class GenerationSlots:
+    """
+    Cross-process generation permits: a semaphore of `size` plus the pid
+    holding each permit, so the permits of a process that died while holding
+    them can be given back (release_dead). Pass to processes at spawn.
+    """
+
+    def __init__(self, size: int, ctx=None):
+        ctx = ctx or multiprocessing.get_context("spawn")
+        self._sem = ctx.BoundedSemaphore(size)
+        self._holders = ctx.Array('i', size)  # pid per permit, 0 = free
+
+    def acquire(self, block: bool = False) -> bool:
+        with self._holders.get_lock():
+            if not self._sem.acquire(block=block):
+                return False
+            self._holders[self._holders[:].index(0)] = os.getpid()
+        return True
+
+    def release(self):
+        with self._holders.get_lock():
+            self._holders[self._holders[:].index(os.getpid())] = 0
+            self._sem.release()
+
+    def release_dead(self, pid: int) -> int:
+        """Give back the permits held by `pid` (a process known to be dead); returns how many."""
+        released = 0
+        with self._holders.get_lock():
+            for i, holder in enumerate(self._holders[:]):
+                if holder == pid:
+                    self._holders[i] = 0
+                    self._sem.release()
+                    released += 1
+        return released
+
+    def holders(self) -> list:
+        with self._holders.get_lock():
+            return [pid for pid in self._holders[:] if pid]
+
+
+@dataclass
+class RequestContext:
+    """Who is asking and until when the answer is still useful (monotonic time)."""
+    client_id: str
+    deadline: float
+
+
+# set by the API per request; read by SQLCoderAgent before each generation
+request_context: ContextVar[Optional[RequestContext]] = ContextVar("request_context", default=None)
+
+
+class Overloaded(Exception):
+    """Rejected by admission control; status_code is 429 (client over its share) or 503."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(f"{reason}, retry after {retry_after}s")
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Ticket:
+    client_id: str
+    deadline: float
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted: bool = False
+    dropped: bool = False
+
+
+class GenerationScheduler:
+    """
+    Admission control in front of the model:
+    - at most max_concurrent generations run at once
+    - a bounded queue (max_queue overall, max_queue_per_client per client)
+    - clients are served round-robin, so one busy client can't starve others
+    - a request is not started when the expected generation time (EWMA of
+      recent ones) would end past its deadline; it is dropped instead
+    - rejections are immediate, with a Retry-After estimate
+    With `slots` (GenerationSlots of max_concurrent), a slot also
+    needs a permit that other processes (job workers) compete for, so
+    max_concurrent holds across processes; their releases are noticed by
+    polling every poll_s.
+    """
+
+    def __init__(self,
+                 max_concurrent: int = 1,
+                 max_queue: int = 32,
+                 max_queue_per_client: int = 4,
+                 initial_estimate_s: float = 10.0,
+                 ewma_alpha: float = 0.2,
+                 slots=None,
+                 poll_s: float = 0.1):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.ewma_alpha = ewma_alpha
+        self.estimate_s = initial_estimate_s
+        self.slots = slots
+        self.poll_s = poll_s
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._queues = OrderedDict()  # client -> deque of tickets, round-robin order
+
+    def _retry_after(self, position: int) -> int:
+        return max(1, math.ceil((position / self.max_concurrent + 1) * self.estimate_s))
+
+    def _reject(self, status_code: int, reason: str, position: int):
+        metrics.increment("scheduler_rejected", {"reason": reason})
+        raise Overloaded(status_code, reason, self._retry_after(position))
+
+    def _dispatch(self):
+        """Grant free slots round-robin across clients. Caller holds the lock."""
+        now = time.monotonic()
+        while self._active < self.max_concurrent and self._queues:
+            client_id, queue = next(iter(self._queues.items()))
+            expired = now + self.estimate_s > queue[0].deadline
+            if not expired and self.slots is not None and not self.slots.acquire(block=False):
+                break  # all permits held, some by other processes
+            ticket = queue.popleft()
+            self._queued -= 1
+            del self._queues[client_id]
+            if queue:
+                self._queues[client_id] = queue  # back of the round-robin line
+
+            if expired:
+                ticket.dropped = True
+                metrics.increment("scheduler_rejected", {"reason": "deadline"})
+                continue
+            ticket.granted = True
+            self._active += 1
+        self._cond.notify_all()
+
+    def acquire(self, client_id: str, deadline: float) -> _Ticket:
+        with self._cond:
+            position = self._queued
+            if self._queued >= self.max_queue:
+                self._reject(503, "queue_full", position)
+            if len(self._queues.get(client_id, ())) >= self.max_queue_per_client:
+                self._reject(429, "client_queue_full", len(self._queues[client_id]))
+
+            # expected start: everyone ahead of us, spread over the slots
+            busy = self._active >= self.max_concurrent
+            expected_wait = (self._queued / self.max_concurrent + (1 if busy else 0)) * self.estimate_s
+            if time.monotonic() + expected_wait + self.estimate_s > deadline:
+                self._reject(503, "deadline", position)
+
+            ticket = _Ticket(client_id, deadline)
+            self._queues.setdefault(client_id, deque()).append(ticket)
+            self._queued += 1
+            metrics.observe("scheduler_queue_depth", self._queued)
+            self._dispatch()
+
+            while not ticket.granted and not ticket.dropped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if self.slots is None:
+                    self._cond.wait(timeout=remaining)
+                else:
+                    self._cond.wait(timeout=min(remaining, self.poll_s))
+                    self._dispatch()
+
+            if not ticket.granted:
+                if not ticket.dropped:  # still queued at its deadline
+                    self._queues[client_id].remove(ticket)
+                    if not self._queues[client_id]:
+                        del self._queues[client_id]
+                    self._queued -= 1
+                    metrics.increment("scheduler_rejected", {"reason": "deadline"})
+                raise Overloaded(503, "deadline", self._retry_after(self._queued))
+
+        metrics.observe("scheduler_wait_s", time.monotonic() - ticket.enqueued_at)
+        return ticket
+
+    def release(self, duration_s: Optional[float] = None):
+        """Free the slot; duration_s of a completed generation updates the estimate."""
+        with self._cond:
+            self._active -= 1
+            if self.slots is not None:
+                self.slots.release()
+            if duration_s is not None:
+                self.estimate_s += self.ewma_alpha * (duration_s - self.estimate_s)
+            self._dispatch()
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "active": self._active,
+                "queued": self._queued,
+                "clients_waiting": len(self._queues),
+                "estimate_s": round(self.estimate_s, 2),
+            }
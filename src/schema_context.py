@@ -0,0 +1,227 @@
+"""
+Token-budgeted schema context for the SQL prompt.
+
+Instead of full description blobs plus DDL for every retrieved table, each
+table is rendered as one compact CREATE TABLE with only its relevant columns
+and the keys needed to join the other selected tables; per-column notes and
+the remaining prose from db.json go into SQL comments while the budget allows.
+"""
+import logging
+import math
+import os
+import re
+from functools import lru_cache
+from typing import Dict, List
+
+from src.schema_index import _plain
+
+logger = logging.getLogger(__name__)
+
+# saved by `python -m scripts.fetch_tokenizer`
+DEFAULT_TOKENIZER = "models/sqlcoder/tokenizer.json"
+
+# fallback column types when the schema has no 'column_types' (curated db.json)
+TYPE_MAPPING = {
+    'id': 'INTEGER PRIMARY KEY',
+    'user_id': 'INTEGER',
+    'competition_id': 'INTEGER',
+    'participation_id': 'INTEGER',
+    'task_type_id': 'INTEGER',
+    'metric_id': 'INTEGER',
+    'dataset_id': 'INTEGER',
+    'submission_id': 'INTEGER',
+    'evaluation_id': 'INTEGER',
+    'organizer_id': 'INTEGER',
+    'config_id': 'INTEGER',
+    'prize_id': 'INTEGER',
+    'file_id': 'INTEGER',
+    'kernel_id': 'INTEGER',
+    'row_id': 'INTEGER',
+    'best_evaluation_id': 'INTEGER',
+    'created_at': 'TIMESTAMP',
+    'submitted_at': 'TIMESTAMP',
+    'registered_at': 'TIMESTAMP',
+    'computed_at': 'TIMESTAMP',
+    'updated_at': 'TIMESTAMP',
+    'start_at': 'TIMESTAMP',
+    'end_at': 'TIMESTAMP',
+    'amount': 'NUMERIC',
+    'metric_value': 'NUMERIC',
+    'score': 'NUMERIC',
+    'size_bytes': 'BIGINT',
+    'rank': 'INTEGER',
+    'rank_position': 'INTEGER',
+    'max_daily_submissions': 'INTEGER',
+    'is_hidden': 'BOOLEAN',
+    'is_valid': 'BOOLEAN'
+}
+
+# column notes that only restate the key role or the type
+_REDUNDANT_NOTES = re.compile(r'^(pk|fk( to .*)?|text|numeric|timestamp|boolean|integer)$', re.IGNORECASE)
+_TABLE_PREFIX = re.compile(r'^\s*Table:\s*[^.]*\.\s*')
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
+
+
+class TokenCounter:
+    """
+    Counts tokens with the generation model's tokenizer (a local tokenizer.json,
+    or a Hugging Face repo id, via `tokenizers`). Without it, estimates
+    ~4 characters per token. A repo id is only looked up in the local Hugging
+    Face cache unless download=True, so a process without network access
+    doesn't stall on hub retries.
+    """
+
+    def __init__(self, tokenizer: str = DEFAULT_TOKENIZER, download: bool = False):
+        self.tokenizer = None
+        try:
+            from tokenizers import Tokenizer
+            if os.path.exists(tokenizer):
+                self.tokenizer = Tokenizer.from_file(tokenizer)
+            elif tokenizer.endswith('.json'):
+                raise FileNotFoundError(f"{tokenizer} not found (python -m scripts.fetch_tokenizer)")
+            elif download:
+                self.tokenizer = Tokenizer.from_pretrained(tokenizer)
+            else:
+                from huggingface_hub import hf_hub_download
+                self.tokenizer = Tokenizer.from_file(
+                    hf_hub_download(tokenizer, "tokenizer.json", local_files_only=True))
+        except Exception as e:
+            logger.warning(f"Tokenizer '{tokenizer}' unavailable, estimating tokens from length: {e}")
+
+    def count(self, text: str) -> int:
+        if self.tokenizer is None:
+            return math.ceil(len(text) / 4)
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+@lru_cache(maxsize=None)
+def load_token_counter(tokenizer: str = DEFAULT_TOKENIZER, download: bool = False) -> TokenCounter:
+    """One counter per tokenizer per process (shared by all tenants)."""
+    return TokenCounter(tokenizer, download)
+
+
+def split_description(description: str) -> tuple:
+    """
+    Split a db.json description into (column notes, prose sentences):
+    'Columns: a (PK), b (note), c.' becomes {'a': 'PK', 'b': 'note'}; the
+    'Table: ...' header and the column list itself are dropped as redundant.
+    """
+    text = _TABLE_PREFIX.sub('', description)
+    notes = {}
+    start = text.find('Columns:')
+    if start >= 0:
+        i, depth, item = start + len('Columns:'), 0, ''
+        items = []
+        while i < len(text):
+            ch = text[i]
+            if ch == '(':
+                depth += 1
+            elif ch == ')':
+                depth -= 1
+            if depth == 0 and ch in ',.':
+                items.append(item.strip())
+                item = ''
+                if ch == '.':
+                    i += 1
+                    break
+            else:
+                item += ch
+            i += 1
+        for entry in items:
+            name, _, note = entry.partition(' (')
+            if name:
+                notes[name.strip()] = note.rstrip(')').strip()
+        text = text[:start] + text[i:]
+    sentences = [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+    return notes, sentences
+
+
+class SchemaContextBuilder:
+    """
+    Renders ranked tables into a schema context that fits a token budget.
+
+    Every table starts at its leanest form (keys + top min_columns columns,
+    no comments); tables are added in rank order while they fit, then
+    upgraded, most relevant first, to up to max_columns relevant columns
+    with their notes, and finally to include the description prose.
+    """
+
+    def __init__(self, counter: TokenCounter, max_columns: int = 8, min_columns: int = 2):
+        self.counter = counter
+        self.max_columns = max_columns
+        self.min_columns = min_columns
+
+    @staticmethod
+    def _join_keys(item: dict, selected: set, pk_owner: dict) -> Dict[str, str]:
+        """Columns referencing another selected table -> that table."""
+        declared = item.get('foreign_keys')
+        if declared is None:
+            declared = {col: pk_owner.get(col) for col in item['attributes'][1:]}
+        return {col: target for col, target in declared.items() if target in selected and target != item['table']}
+
+    def _render(self, item: dict, columns: List[str], fks: Dict[str, str],
+                notes: Dict[str, str], prose: List[str]) -> str:
+        column_types = item.get('column_types', {})
+        lines = []
+        for i, col in enumerate(columns):
+            col_type = column_types.get(col) or TYPE_MAPPING.get(col, 'TEXT')
+            if col == item['attributes'][0] and 'PRIMARY KEY' not in col_type:
+                col_type += ' PRIMARY KEY'
+            line = f"  {col} {col_type}"
+            if col in fks:
+                line += f" REFERENCES {fks[col]}"
+            if i < len(columns) - 1:
+                line += ","  # before the comment, which runs to the end of the line
+            if notes.get(col):
+                line += f" -- {notes[col]}"
+            lines.append(line)
+        body = "\n".join(lines)
+        header = ''.join(f"-- {sentence}\n" for sentence in prose)
+        return f"{header}CREATE TABLE {item['table']} (\n{body}\n);"
+
+    def _variants(self, item: dict, column_scores: Dict[str, float], selected: set, pk_owner: dict) -> List[str]:
+        """Renderings of one table from leanest to richest."""
+        attributes = item['attributes']
+        fks = self._join_keys(item, selected, pk_owner)
+        keys = {attributes[0]} | set(fks) if attributes else set(fks)
+        ranked = sorted((c for c in attributes if c not in keys),
+                        key=lambda c: column_scores.get(c, 0.0), reverse=True)
+
+        def columns(n):
+            chosen = keys | set(ranked[:n])
+            return [c for c in attributes if c in chosen]
+
+        notes, prose = split_description(item.get('description', ''))
+        notes = {col: note for col, note in notes.items() if note and not _REDUNDANT_NOTES.match(note)}
+        return [
+            self._render(item, columns(self.min_columns), fks, {}, []),
+            self._render(item, columns(self.max_columns), fks, notes, []),
+            self._render(item, columns(self.max_columns), fks, notes, prose),
+        ]
+
+    def build(self, schema: list, tables: List[str], column_scores: Dict[str, Dict[str, float]],
+              budget: int) -> str:
+        by_table = {item['table']: item for item in schema}
+        tables = [t for t in tables if t in by_table]
+        selected = set(tables)
+        pk_owner = {item['attributes'][0]: item['table'] for item in schema if item['attributes']}
+
+        variants = {t: self._variants(by_table[t], column_scores.get(t, {}), selected, pk_owner) for t in tables}
+        costs = {t: [self.counter.count(v) + 1 for v in vs] for t, vs in variants.items()}
+
+        level, used = {}, 0
+        for t in tables:
+            if used + costs[t][0] <= budget or not level:  # the top table always goes in
+                level[t] = 0
+                used += costs[t][0]
+        for target in (1, 2):
+            for t in level:
+                extra = costs[t][target] - costs[t][level[t]]
+                if used + extra <= budget:
+                    used += extra
+                    level[t] = target
+
+        dropped = [t for t in tables if t not in level]
+        if dropped:
+            logger.info(f"Schema context over budget, dropped: {', '.join(_plain(t) for t in dropped)}")
+        return "\n\n".join(variants[t][lvl] for t, lvl in level.items())
@@ -0,0 +1,383 @@
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, List, Optional
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+_IDENT_RE = re.compile(r'[a-z0-9_]+')
+
+
+def _plain(table: str) -> str:
+    """'"user"' -> 'user'"""
+    return table.strip('"')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lexical tokens: whole identifiers (max_daily_submissions) plus their parts,
+    with a naive singular form so 'submissions' hits 'submission'.
+    """
+    text = text.lower()
+    tokens = _WORD_RE.findall(text)
+    tokens += [t for t in _IDENT_RE.findall(text) if '_' in t]
+    tokens += [t[:-1] for t in tokens if len(t) > 3 and t.endswith('s') and not t.endswith('ss')]
+    return tokens
+
+
+class BM25:
+    """Small in-memory BM25 over a dict of doc_id -> tokens."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # token -> {doc_id: tf}
+        self.doc_len = {}
+        self.total_len = 0
+
+    def add(self, doc_id: int, tokens: List[str]):
+        self.doc_len[doc_id] = len(tokens)
+        self.total_len += len(tokens)
+        for tok in tokens:
+            self.postings[tok][doc_id] = self.postings[tok].get(doc_id, 0) + 1
+
+    def remove(self, doc_id: int, tokens: List[str]):
+        self.total_len -= self.doc_len.pop(doc_id, 0)
+        for tok in set(tokens):
+            docs = self.postings.get(tok)
+            if docs is not None:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[tok]
+
+    def copy(self) -> "BM25":
+        other = BM25(self.k1, self.b)
+        other.postings = defaultdict(dict, {tok: dict(docs) for tok, docs in self.postings.items()})
+        other.doc_len = dict(self.doc_len)
+        other.total_len = self.total_len
+        return other
+
+    def scores(self, query_tokens: List[str], max_postings: int = None, doc_ids: list = None) -> dict:
+        """
+        Scores of documents matching any query token, or of doc_ids only.
+        Tokens in more than max_postings documents (id, status, ...) carry
+        little weight and are skipped, which bounds the cost on large schemas.
+        """
+        n = len(self.doc_len)
+        if not n:
+            return {}
+        avg_len = self.total_len / n
+        scores = defaultdict(float)
+        for tok in set(query_tokens):
+            docs = self.postings.get(tok)
+            if not docs or (max_postings and len(docs) > max_postings):
+                continue
+            if doc_ids is not None:
+                docs = {doc_id: docs[doc_id] for doc_id in doc_ids if doc_id in docs}
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+
+class SchemaIndex:
+    """
+    Hybrid schema retrieval over table- and column-level documents.
+
+    - dense: normalized embeddings, inner product (cosine); exact IndexFlatIP
+      for small schemas, HNSW once the number of documents exceeds ann_threshold
+    - lexical: BM25 over identifiers, fused with the dense score; tokens
+      matching more than lexical_max_postings documents are ignored
+    - graph: top tables are expanded along foreign-key edges
+
+    update() re-embeds only tables whose text changed and patches the index
+    in place; searches keep running and only wait for the short swap. BM25 is
+    copy-on-write, so lexical scoring runs outside the lock. The dense index
+    is rebuilt at the end of update(), outside the lock, when deleted HNSW vectors exceed
+    compact_fraction of the documents, or when the document count crosses
+    ann_threshold (flat <-> HNSW).
+    """
+
+    def __init__(self,
+                 schema: list,
+                 encode: Callable[[List[str]], np.ndarray],
+                 ann_threshold: int = 20000,
+                 hnsw_m: int = 32,
+                 hnsw_ef_search: int = 128,
+                 lexical_weight: float = 0.3,
+                 lexical_max_postings: int = 1000,
+                 fk_decay: float = 0.8,
+                 compact_fraction: float = 0.2):
+        self.encode = encode
+        self.ann_threshold = ann_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_search = hnsw_ef_search
+        self.lexical_weight = lexical_weight
+        self.lexical_max_postings = lexical_max_postings
+        self.fk_decay = fk_decay
+        self.compact_fraction = compact_fraction
+
+        self._lock = threading.Lock()
+        self.docs = {}  # doc_id -> (table, column or None)
+        self.column_docs = defaultdict(dict)  # table -> {column: doc_id}
+        self.doc_tokens = {}
+        self.fingerprints = {}  # table -> hash of its indexed text
+        self.bm25 = BM25()
+        self._next_id = 0
+        self.tombstones = 0
+        self._generation = 0  # bumped on every change of the documents
+
+        doc_ids, texts = self._prepare_docs(schema)
+        embeddings = self._normalize(self.encode(texts))
+        self.index = self._make_index(embeddings.shape[1], len(texts))
+        self.hnsw = len(texts) > ann_threshold
+        self._add_docs(doc_ids, embeddings, self.bm25)
+        self._set_schema(schema)
+        logger.info(f"Schema index: {len(self.schema)} tables, {len(texts)} documents, "
+                    f"{'HNSW' if self.hnsw else 'flat'} dense index")
+
+    @staticmethod
+    def describe_table(item: dict) -> str:
+        return (
+            f"Table: {item['table']}\n"
+            f"{item['description']}\n"
+            f"Columns: {', '.join(item['attributes'])}"
+        )
+
+    @classmethod
+    def fingerprint(cls, item: dict) -> str:
+        return hashlib.sha1(cls.describe_table(item).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _table_documents(item: dict):
+        """Yield (column, text) pairs: one table-level doc, then one per column."""
+        table = _plain(item['table'])
+        yield None, f"{table} {table.replace('_', ' ')}: {item['description']}"
+        for col in item['attributes']:
+            yield col, f"{table}.{col}: {col.replace('_', ' ')} of {table.replace('_', ' ')}"
+
+    @staticmethod
+    def _normalize(embeddings) -> np.ndarray:
+        embeddings = np.array(embeddings, dtype='float32', order='C')  # copy: normalized in place
+        faiss.normalize_L2(embeddings)
+        return embeddings
+
+    def _make_index(self, dim: int, n_docs: int):
+        if n_docs > self.ann_threshold:
+            base = faiss.IndexHNSWFlat(dim, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            base.hnsw.efSearch = self.hnsw_ef_search
+        else:
+            base = faiss.IndexFlatIP(dim)
+        return faiss.IndexIDMap2(base)
+
+    def _prepare_docs(self, items: list):
+        """Allocate doc ids for the tables' documents; returns (pending docs, texts)."""
+        pending, texts = [], []
+        for item in items:
+            for column, text in self._table_documents(item):
+                pending.append((self._next_id, item['table'], column, tokenize(text)))
+                texts.append(text)
+                self._next_id += 1
+        return pending, texts
+
+    def _add_docs(self, pending: list, embeddings: np.ndarray, bm25: BM25):
+        for doc_id, table, column, tokens in pending:
+            self.docs[doc_id] = (table, column)
+            if column is not None:
+                self.column_docs[table][column] = doc_id
+            self.doc_tokens[doc_id] = tokens
+            bm25.add(doc_id, tokens)
+        ids = np.array([p[0] for p in pending], dtype='int64')
+        self.index.add_with_ids(embeddings, ids)  # type: ignore
+
+    def _remove_docs(self, doc_ids: list, bm25: BM25):
+        for doc_id in doc_ids:
+            table, column = self.docs.pop(doc_id, (None, None))
+            if self.column_docs.get(table, {}).get(column) == doc_id:
+                del self.column_docs[table][column]
+            bm25.remove(doc_id, self.doc_tokens.pop(doc_id, []))
+        if not doc_ids:
+            return
+        if self.hnsw:
+            # HNSW can't delete vectors; dropped ids are skipped at search time
+            self.tombstones += len(doc_ids)
+        else:
+            self.index.remove_ids(np.array(doc_ids, dtype='int64'))  # type: ignore
+
+    def _set_schema(self, schema: list):
+        self.schema = list(schema)
+        self.descriptions = [self.describe_table(item) for item in self.schema]
+        self.description_by_table = {item['table']: d for item, d in zip(self.schema, self.descriptions)}
+        self.fingerprints = {item['table']: self.fingerprint(item) for item in self.schema}
+        self.neighbors = self._build_fk_graph()
+
+    def _build_fk_graph(self) -> dict:
+        """
+        Undirected table graph from 'foreign_keys' in the schema; columns named
+        like another table's primary key are linked when no FKs are declared.
+        """
+        tables = {item['table'] for item in self.schema}
+        pk_owner = {item['attributes'][0]: item['table'] for item in self.schema if item['attributes']}
+        neighbors = defaultdict(set)
+        for item in self.schema:
+            declared = item.get('foreign_keys')
+            if declared is not None:
+                targets = [t for t in declared.values() if t in tables]
+            else:
+                targets = [pk_owner.get(col) for col in item['attributes'][1:]]
+            for target in targets:
+                if target is not None and target != item['table']:
+                    neighbors[item['table']].add(target)
+                    neighbors[target].add(item['table'])
+        return neighbors
+
+    def update(self, schema: list) -> List[str]:
+        """
+        Bring the index in line with `schema`. Only new or changed tables are
+        re-embedded (outside the lock); their old documents are removed and the
+        new ones added in place. Returns the names of changed/removed tables.
+        """
+        new_tables = {item['table'] for item in schema}
+        changed = [item for item in schema if self.fingerprint(item) != self.fingerprints.get(item['table'])]
+        removed = [t for t in self.fingerprints if t not in new_tables]
+        if not changed and not removed:
+            with self._lock:
+                self._set_schema(schema)  # FK / type-only changes
+            return []
+
+        with self._lock:
+            pending, texts = self._prepare_docs(changed)
+        embeddings = self._normalize(self.encode(texts)) if texts else None
+
+        stale_tables = {item['table'] for item in changed} | set(removed)
+        with self._lock:
+            # searches score BM25 without the lock: patch a copy and swap it in
+            bm25 = self.bm25.copy()
+            stale = [doc_id for doc_id, (table, _) in self.docs.items() if table in stale_tables]
+            self._remove_docs(stale, bm25)
+            if pending:
+                self._add_docs(pending, embeddings, bm25)
+            self.bm25 = bm25
+            self._set_schema(schema)
+            self._generation += 1
+
+        if self._rebuild_needed():
+            self._rebuild()
+
+        touched = sorted(stale_tables)
+        logger.info(f"Schema index updated: {len(changed)} re-embedded, {len(removed)} removed "
+                    f"({', '.join(touched)})")
+        return touched
+
+    def _rebuild_needed(self) -> bool:
+        n_docs = len(self.docs)
+        if n_docs and self.hnsw != (n_docs > self.ann_threshold):
+            return True
+        return self.hnsw and self.tombstones > self.compact_fraction * n_docs
+
+    def _rebuild(self) -> bool:
+        """
+        Re-create the dense index from the live documents' stored vectors
+        (dropping HNSW tombstones, switching flat/HNSW by size). Built outside
+        the lock; skipped if the documents changed meanwhile.
+        """
+        with self._lock:
+            generation = self._generation
+            ids = np.array(sorted(self.docs), dtype='int64')
+            vectors = np.vstack([self.index.reconstruct(int(doc_id)) for doc_id in ids])
+        start = time.perf_counter()
+        index = self._make_index(vectors.shape[1], len(ids))
+        index.add_with_ids(vectors, ids)  # type: ignore
+        with self._lock:
+            if self._generation != generation:
+                return False  # the next update() retries
+            dropped = self.tombstones
+            self.index, self.hnsw, self.tombstones = index, len(ids) > self.ann_threshold, 0
+        logger.info(f"Schema index rebuilt in {time.perf_counter() - start:.2f}s: {len(ids)} documents, "
+                    f"{'HNSW' if self.hnsw else 'flat'}, {dropped} deleted vectors dropped")
+        return True
+
+    def search(self, query: str, top_k: int = 5,
+               query_embedding: Optional[np.ndarray] = None) -> List[tuple]:
+        """Return top_k [(table, score)] by fused dense + lexical score."""
+        if query_embedding is None:
+            query_embedding = self.encode([query])
+        q = self._normalize(np.asarray(query_embedding).reshape(1, -1))
+        query_tokens = tokenize(query)
+
+        with self._lock:
+            n_candidates = min(self.index.ntotal, max(top_k * 10, 50) + self.tombstones)
+            sims, ids = self.index.search(q, n_candidates)  # type: ignore
+
+            hits = [(float(sim), self.docs.get(int(doc_id))) for sim, doc_id in zip(sims[0], ids[0])]
+            bm25 = self.bm25
+
+        dense = {}
+        for sim, doc in hits:
+            if doc is not None:
+                dense[doc[0]] = max(dense.get(doc[0], -1.0), sim)
+
+        lexical = {}
+        if self.lexical_weight:
+            docs = self.docs
+            for doc_id, score in bm25.scores(query_tokens, self.lexical_max_postings).items():
+                doc = docs.get(doc_id)  # None if removed by a concurrent update
+                if doc is not None:
+                    lexical[doc[0]] = max(lexical.get(doc[0], 0.0), score)
+
+        lex_max = max(lexical.values(), default=0.0) or 1.0
+        dense_floor = min(dense.values(), default=0.0)
+        fused = {}
+        for table in set(dense) | set(lexical):
+            fused[table] = ((1 - self.lexical_weight) * dense.get(table, dense_floor)
+                            + self.lexical_weight * lexical.get(table, 0.0) / lex_max)
+
+        return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+
+    def column_scores(self, query: str, tables: List[str],
+                      query_embedding: Optional[np.ndarray] = None) -> dict:
+        """
+        Fused dense + lexical score of every column of `tables`:
+        {table: {column: score}}. Dense similarity is exact (stored vectors).
+        """
+        if query_embedding is None:
+            query_embedding = self.encode([query])
+        q = self._normalize(np.asarray(query_embedding).reshape(1, -1))[0]
+        query_tokens = tokenize(query)
+
+        with self._lock:
+            keys = [(table, column, doc_id) for table in tables
+                    for column, doc_id in self.column_docs.get(table, {}).items()]
+            if not keys:
+                return {}
+            vectors = np.vstack([self.index.reconstruct(doc_id) for _, _, doc_id in keys])
+            # same snapshot as the keys; restricted to them, so cheap under the lock
+            lexical = self.bm25.scores(query_tokens, doc_ids=[doc_id for _, _, doc_id in keys])
+
+        dense = vectors @ q
+        lex = [lexical.get(doc_id, 0.0) for _, _, doc_id in keys]
+        lex_max = max(lex) or 1.0
+        scores = defaultdict(dict)
+        for (table, column, _), d, l in zip(keys, dense, lex):
+            scores[table][column] = (1 - self.lexical_weight) * float(d) + self.lexical_weight * l / lex_max
+        return dict(scores)
+
+    def expand(self, hits: List[tuple], limit: int = 2) -> List[tuple]:
+        """Up to `limit` FK neighbours of the hit tables, scored by the best adjacent hit."""
+        neighbors = self.neighbors
+        selected = {table for table, _ in hits}
+        expanded = {}
+        for table, score in hits:
+            for neighbor in neighbors.get(table, ()):
+                if neighbor not in selected:
+                    expanded[neighbor] = max(expanded.get(neighbor, 0.0), score * self.fk_decay)
+        return sorted(expanded.items(), key=lambda kv: kv[1], reverse=True)[:limit]
@@ -0,0 +1,181 @@
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+COLUMNS_SQL = text("""
+    SELECT c.table_name, c.column_name, c.data_type,
+           col_description(cl.oid, c.ordinal_position::int) AS comment
+    FROM information_schema.columns c
+    JOIN pg_namespace n ON n.nspname = c.table_schema
+    JOIN pg_class cl ON cl.relnamespace = n.oid AND cl.relname = c.table_name
+    WHERE c.table_schema = :schema AND cl.relkind IN ('r', 'p')
+    ORDER BY c.table_name, c.ordinal_position
+""")
+
+TABLES_SQL = text("""
+    SELECT cl.relname AS table_name,
+           obj_description(cl.oid, 'pg_class') AS comment,
+           GREATEST(cl.reltuples, 0)::bigint AS row_estimate
+    FROM pg_class cl
+    JOIN pg_namespace n ON n.oid = cl.relnamespace
+    WHERE n.nspname = :schema AND cl.relkind IN ('r', 'p')
+""")
+
+FOREIGN_KEYS_SQL = text("""
+    SELECT src.relname AS table_name, a.attname AS column_name, dst.relname AS ref_table
+    FROM pg_constraint con
+    JOIN pg_class src ON src.oid = con.conrelid
+    JOIN pg_class dst ON dst.oid = con.confrelid
+    JOIN pg_namespace n ON n.oid = src.relnamespace
+    JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = con.conkey[1]
+    WHERE con.contype = 'f' AND n.nspname = :schema
+""")
+
+# cheap change detector: columns/types, FK constraints and comments
+SIGNATURE_SQL = text("""
+    SELECT md5(coalesce(string_agg(x, '|' ORDER BY x), '')) FROM (
+        SELECT c.table_name || '.' || c.column_name || ':' || c.data_type AS x
+        FROM information_schema.columns c WHERE c.table_schema = :schema
+        UNION ALL
+        SELECT con.conname || ':' || con.conrelid::regclass::text
+        FROM pg_constraint con JOIN pg_namespace n ON n.oid = con.connamespace
+        WHERE n.nspname = :schema AND con.contype = 'f'
+        UNION ALL
+        SELECT d.objoid::text || '.' || d.objsubid || ':' || d.description
+        FROM pg_description d
+        JOIN pg_class cl ON cl.oid = d.objoid
+        JOIN pg_namespace n ON n.oid = cl.relnamespace
+        WHERE n.nspname = :schema
+    ) s
+""")
+
+
+def _quoted(name: str) -> str:
+    """Table names are always double-quoted in the schema, as in data/db.json."""
+    return f'"{name}"'
+
+
+def schema_signature(engine, schema: str = 'public') -> str:
+    with engine.connect() as conn:
+        return conn.execute(SIGNATURE_SQL, {"schema": schema}).scalar() or ''
+
+
+def introspect_schema(engine, schema: str = 'public') -> list:
+    """
+    Read tables, column types, foreign keys, comments and row-count estimates
+    from pg_catalog / information_schema into the data/db.json item format.
+    """
+    params = {"schema": schema}
+    with engine.connect() as conn:
+        columns = conn.execute(COLUMNS_SQL, params).mappings().all()
+        tables = conn.execute(TABLES_SQL, params).mappings().all()
+        fks = conn.execute(FOREIGN_KEYS_SQL, params).mappings().all()
+
+    table_cols = defaultdict(list)
+    for row in columns:
+        table_cols[row['table_name']].append(row)
+    table_fks = defaultdict(dict)
+    for row in fks:
+        table_fks[row['table_name']][row['column_name']] = _quoted(row['ref_table'])
+
+    items = []
+    for row in sorted(tables, key=lambda r: r['table_name']):
+        name = row['table_name']
+        cols = table_cols.get(name, [])
+        fk_map = table_fks.get(name, {})
+
+        notes = []
+        for col in cols:
+            note = col['column_name']
+            extra = [f"FK to {fk_map[col['column_name']]}"] if col['column_name'] in fk_map else []
+            if col['comment']:
+                extra.append(col['comment'])
+            if extra:
+                note += f" ({'; '.join(extra)})"
+            notes.append(note)
+
+        description = f"Table: {_quoted(name)}."
+        if row['comment']:
+            description += f" {row['comment']}"
+        description += f" Columns: {', '.join(notes)}."
+
+        items.append({
+            "table": _quoted(name),
+            "description": description,
+            "attributes": [col['column_name'] for col in cols],
+            "foreign_keys": fk_map,
+            "examples": [],
+            "column_types": {col['column_name']: col['data_type'].upper() for col in cols},
+            "row_estimate": row['row_estimate'],
+        })
+    return items
+
+
+def merge_schema(live: list, curated: list) -> list:
+    """
+    Live structure wins (tables, columns, types, FKs); curated descriptions and
+    examples from data/db.json are kept for tables that still exist.
+    """
+    curated_by_table = {item['table']: item for item in curated}
+    merged = []
+    for item in live:
+        cur = curated_by_table.get(item['table'])
+        if cur:
+            item = dict(item, description=cur['description'], examples=cur.get('examples', []))
+            missing = set(cur['attributes']) - set(item['attributes'])
+            if missing:
+                logger.warning(f"{item['table']}: curated columns no longer in database: {', '.join(sorted(missing))}")
+        merged.append(item)
+
+    dropped = set(curated_by_table) - {item['table'] for item in live}
+    if dropped:
+        logger.warning(f"Curated tables not found in database: {', '.join(sorted(dropped))}")
+    return merged
+
+
+class SchemaWatcher:
+    """
+    Background thread polling the catalog signature; on change it re-introspects,
+    merges with the curated schema and hands the result to `on_change`.
+    """
+
+    def __init__(self, engine, curated: list, on_change: Callable[[list], object],
+                 interval_s: float = 30.0, schema: str = 'public',
+                 signature: Optional[str] = None):
+        self.engine = engine
+        self.curated = curated
+        self.on_change = on_change
+        self.interval_s = interval_s
+        self.schema = schema
+        self.signature = signature
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="schema-watcher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=self.interval_s)
+
+    def check(self) -> bool:
+        """Run one poll; returns True if the schema changed."""
+        signature = schema_signature(self.engine, self.schema)
+        if signature == self.signature:
+            return False
+        merged = merge_schema(introspect_schema(self.engine, self.schema), self.curated)
+        self.on_change(merged)
+        self.signature = signature
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Schema refresh failed: {e}")
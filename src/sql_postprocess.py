@@ -0,0 +1,252 @@
+"""
+Post-processing of raw model output into a single SQL statement.
+
+A pipeline of text steps (on the raw response) followed by token steps (on
+the tokenized SQL). String literals and quoted identifiers are single
+tokens, so fixes never touch literals or parts of longer identifiers.
+All patterns are compiled once, at import.
+"""
+import json
+import os
+import re
+from typing import Callable, Dict, List
+
+_CODE_BLOCK = re.compile(r'```sql\s*([^`]+)\s*```', re.IGNORECASE | re.DOTALL)
+_NOISE = re.compile(r'</?s>|\[SQL\]')
+_DELIMITERS = re.compile(r'\[QUESTION\]|\[/QUESTION\]|###|\[/SQL\]|## Response|```')
+
+# whitespace | comment | string literal | quoted identifier | word | number | operator
+_TOKEN = re.compile(r"""
+    \s+
+  | --[^\n]*|/\*.*?(?:\*/|$)
+  | '(?:[^']|'')*'?
+  | "(?:[^"]|"")*"?
+  | [A-Za-z_][A-Za-z0-9_$]*
+  | \d+(?:\.\d*)?(?:[eE][-+]?\d+)?
+  | ::|<=|>=|<>|!=|\|\||.
+""", re.VERBOSE | re.DOTALL)
+
+# keywords after which the next identifier names a table
+_TABLE_CONTEXT = {'FROM', 'JOIN', 'INTO', 'UPDATE', 'TABLE'}
+
+# keywords that end a FROM list before the next table reference
+_CLAUSE_KEYWORDS = {'SELECT', 'WHERE', 'ON', 'USING', 'GROUP', 'ORDER', 'BY', 'HAVING', 'LIMIT', 'SET', 'VALUES'}
+
+_WITH = re.compile(r'\bWITH\b', re.IGNORECASE)
+
+# table names that must be double-quoted in Postgres (reserved words)
+RESERVED = {
+    'all', 'analyse', 'analyze', 'and', 'any', 'array', 'as', 'asc', 'both', 'case', 'cast', 'check',
+    'collate', 'column', 'constraint', 'create', 'current_user', 'default', 'desc', 'distinct', 'do',
+    'else', 'end', 'except', 'false', 'fetch', 'for', 'foreign', 'from', 'grant', 'group', 'having',
+    'in', 'into', 'leading', 'limit', 'not', 'null', 'offset', 'on', 'only', 'or', 'order', 'primary',
+    'references', 'returning', 'select', 'session_user', 'some', 'table', 'then', 'to', 'union',
+    'unique', 'user', 'using', 'when', 'where', 'window', 'with',
+}
+
+
+def tokenize(sql: str) -> List[str]:
+    """Tokens as strings; whitespace and comments are tokens too, so the SQL can be rendered back."""
+    return _TOKEN.findall(sql)
+
+
+def is_word(token: str) -> bool:
+    return token[0].isalpha() or token[0] == '_'
+
+
+def _is_space(token: str) -> bool:
+    """Whitespace or a comment."""
+    return token[0].isspace() or (token[0] in '-/' and token[:2] in ('--', '/*'))
+
+
+def render(tokens: List[str]) -> str:
+    """Join tokens, collapsing whitespace runs to one space; comments are dropped."""
+    out = []
+    pending_space = False
+    for tok in tokens:
+        if _is_space(tok):
+            pending_space = bool(out)
+        elif pending_space:
+            out.append(' ')
+            out.append(tok)
+            pending_space = False
+        else:
+            out.append(tok)
+    return ''.join(out)
+
+
+def extract_sql(text: str) -> str:
+    """The ```sql block if there is one, else the text up to the first prompt/markdown delimiter."""
+    match = _CODE_BLOCK.search(text)
+    if match:
+        return match.group(1)
+    text = _NOISE.sub('', text)
+    return _DELIMITERS.split(text, maxsplit=1)[0]
+
+
+def first_statement(tokens: List[str]) -> List[str]:
+    """Keep everything up to and including the first ';' (outside literals)."""
+    if ';' in tokens:
+        return tokens[:tokens.index(';') + 1]
+    return tokens
+
+
+def table_renames(schema: list) -> Dict[str, str]:
+    """
+    Rename rules from the schema: plural forms of each table (competitions,
+    categories, ...) and the bare name of a reserved-word table (user) map to
+    the table's properly quoted name. Forms that are real table names are kept.
+    """
+    names = [item['table'].strip('"') for item in schema]
+    tables = {name.lower() for name in names}
+    rules = {}
+    for name in names:
+        table = name.lower()
+        target = f'"{name}"' if table in RESERVED or name != table else name
+        forms = {table + 's', table + 'es'}
+        if table.endswith('y'):
+            forms.add(table[:-1] + 'ies')
+        for form in forms - tables:
+            rules[form] = target
+        if table in RESERVED:
+            rules[table] = target
+    return rules
+
+
+class TableRenamer:
+    """
+    Token step: rewrites identifiers in table positions (after FROM/JOIN/...)
+    and, for names renamed there, their uses as qualifiers (users.id).
+    Column names, aliases, literals and CTE names (WITH users AS (...)) are
+    left alone.
+    """
+
+    def __init__(self, rules: Dict[str, str]):
+        self.rules = {k.lower(): v for k, v in rules.items()}
+
+    def __call__(self, tokens: List[str]) -> List[str]:
+        rules = self.rules
+        out = ctes = None
+        renamed = set()
+        qualifiers = []  # (index, name) of candidate words followed by '.'
+        for i, tok in enumerate(tokens):
+            name = tok.lower()
+            if name not in rules or not is_word(tok):
+                continue  # most outputs have no candidates; this loop is all they pay
+            if ctes is None:
+                ctes = self._cte_names(tokens) if _WITH.search(''.join(tokens)) else set()
+            if name in ctes:
+                continue
+            j = i + 1
+            while j < len(tokens) and _is_space(tokens[j]):
+                j += 1
+            if j < len(tokens) and tokens[j] == '.':
+                qualifiers.append((i, name))
+            elif self._table_position(tokens, i):
+                if out is None:
+                    out = list(tokens)
+                out[i] = rules[name]
+                renamed.add(name)
+        if out is None:
+            return tokens
+        for i, name in qualifiers:
+            if name in renamed:
+                out[i] = rules[name]
+        return out
+
+    @staticmethod
+    def _cte_names(tokens: List[str]) -> set:
+        """Names defined by WITH [RECURSIVE] name [(cols)] AS (...) and , name [(cols)] AS (...)."""
+        words = [tok for tok in tokens if not _is_space(tok)]
+        upper = [tok.upper() for tok in words]
+        names = set()
+        if 'WITH' not in upper:  # only inside a literal
+            return names
+        for i in range(upper.index('WITH') + 1, len(words)):
+            if not is_word(words[i]) or upper[i - 1] not in ('WITH', 'RECURSIVE', ','):
+                continue
+            j = i + 1
+            if j < len(words) and words[j] == '(':  # column list
+                depth = 0
+                while j < len(words):
+                    depth += {'(': 1, ')': -1}.get(words[j], 0)
+                    j += 1
+                    if depth == 0:
+                        break
+            if j + 1 < len(words) and upper[j] == 'AS' and words[j + 1] == '(':
+                names.add(words[i].lower())
+        return names
+
+    @staticmethod
+    def _table_position(tokens: List[str], i: int) -> bool:
+        """
+        Right after FROM/JOIN/... (also schema-qualified: FROM public.users), or
+        after a comma in a FROM list: FROM a x, b y / JOIN b USING (id), c /
+        JOIN b ON a.id = b.id, c. Parenthesized groups are skipped.
+        """
+        j = i - 1
+        while j >= 0 and _is_space(tokens[j]):
+            j -= 1
+        if j > 0 and tokens[j] == '.':  # skip the schema name
+            j -= 1
+            while j >= 0 and _is_space(tokens[j]):
+                j -= 1
+            j -= 1
+        comma = False
+        depth = 0
+        for j in range(j, -1, -1):
+            tok = tokens[j]
+            if _is_space(tok):
+                continue
+            upper = tok.upper()
+            if not comma:
+                if upper in _TABLE_CONTEXT:
+                    return True
+                if tok != ',':
+                    return False
+                comma = True
+            elif tok == ')':
+                depth += 1
+            elif tok == '(':
+                if not depth:
+                    return False  # the comma is inside a list: f(a, b), VALUES (...)
+                depth -= 1
+            elif depth:
+                continue
+            elif upper in _TABLE_CONTEXT or upper in ('ON', 'USING'):
+                return True
+            elif upper in _CLAUSE_KEYWORDS or tok == ';':
+                return False
+        return False
+
+
+class SQLPostProcessor:
+    """
+    raw model output -> text_steps -> tokenize -> token_steps -> render.
+    Steps are plain callables, so the pipeline can be extended per deployment.
+    """
+
+    def __init__(self, text_steps: List[Callable[[str], str]] = None,
+                 token_steps: List[Callable[[List[str]], List[str]]] = None):
+        self.text_steps = text_steps if text_steps is not None else [extract_sql]
+        self.token_steps = token_steps if token_steps is not None else [first_statement]
+
+    @classmethod
+    def for_schema(cls, schema: list) -> "SQLPostProcessor":
+        return cls(token_steps=[first_statement, TableRenamer(table_renames(schema))])
+
+    @classmethod
+    def from_schema_file(cls, path: str = 'data/db.json') -> "SQLPostProcessor":
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'r') as f:
+            return cls.for_schema(json.load(f))
+
+    def __call__(self, raw: str) -> str:
+        text = raw
+        for step in self.text_steps:
+            text = step(text)
+        tokens = tokenize(text)
+        for step in self.token_steps:
+            tokens = step(tokens)
+        return render(tokens).strip()
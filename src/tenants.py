@@ -0,0 +1,185 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool
+
+from src.db_models import DATABASE_URL, create_db_engine
+from src.model import SQLCoderAgent
+from src.rag_sql import RAGSQL
+from src.replicas import PRIMARY
+
+logger = logging.getLogger(__name__)
+
+
+class TenantConfig(BaseModel):
+    database_url: str
+    schema_file: Optional[str] = None
+    live_schema: bool = False
+    pool_size: int = 5
+    max_overflow: int = 5
+    replica_urls: List[str] = []
+    max_replica_lag_s: float = 10.0
+
+
+class UnknownTenantError(KeyError):
+    pass
+
+
+def load_tenants(path: str = 'data/tenants.json') -> Dict[str, TenantConfig]:
+    """Tenant registry; falls back to a single 'default' tenant on DATABASE_URL."""
+    if not os.path.exists(path):
+        return {"default": TenantConfig(database_url=DATABASE_URL, schema_file='data/db.json')}
+    with open(path, 'r') as f:
+        return {name: TenantConfig(**cfg) for name, cfg in json.load(f).items()}
+
+
+class _Entry:
+    def __init__(self, rag: RAGSQL):
+        self.rag = rag
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class TenantManager:
+    """
+    Loads a RAGSQL (schema index + connection pool) per tenant on first use.
+    All tenants share one embedder and one Ollama client. Idle tenants are
+    evicted least-recently-used first when more than max_loaded are resident,
+    or once unused for idle_ttl_s; tenants serving a request are never evicted.
+    """
+
+    def __init__(self,
+                 tenants: Dict[str, TenantConfig],
+                 embedder,
+                 sql_agent: SQLCoderAgent = None,
+                 max_loaded: int = 4,
+                 idle_ttl_s: float = 900.0,
+                 rag_kwargs: dict = None):
+        self.tenants = tenants
+        self.embedder = embedder
+        self.sql_agent = sql_agent or SQLCoderAgent()
+        self.max_loaded = max_loaded
+        self.idle_ttl_s = idle_ttl_s
+        self.rag_kwargs = rag_kwargs or {}
+
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()  # tenant -> _Entry, LRU order
+        self._load_locks = {}
+
+    def _load(self, tenant_id: str) -> RAGSQL:
+        cfg = self.tenants[tenant_id]
+        start = time.perf_counter()
+        engine = create_db_engine(cfg.database_url, pool_size=cfg.pool_size,
+                                  max_overflow=cfg.max_overflow, pool_pre_ping=True)
+        rag = RAGSQL(schema_file=cfg.schema_file,
+                     live_schema=cfg.live_schema or not cfg.schema_file,
+                     engine=engine,
+                     embedder=self.embedder,
+                     sql_agent=self.sql_agent,
+                     replica_urls=cfg.replica_urls,
+                     max_replica_lag_s=cfg.max_replica_lag_s,
+                     **self.rag_kwargs)
+        logger.info(f"Loaded tenant '{tenant_id}' in {time.perf_counter() - start:.2f}s")
+        return rag
+
+    def _checkout(self, tenant_id: str) -> _Entry:
+        with self._lock:
+            if tenant_id not in self.tenants:
+                raise UnknownTenantError(tenant_id)
+            entry = self._loaded.get(tenant_id)
+            if entry:
+                self._loaded.move_to_end(tenant_id)
+                entry.in_use += 1
+                return entry
+            load_lock = self._load_locks.setdefault(tenant_id, threading.Lock())
+
+        # slow path outside the global lock: other tenants keep serving
+        with load_lock:
+            with self._lock:
+                entry = self._loaded.get(tenant_id)
+                if entry:
+                    entry.in_use += 1
+                    return entry
+            entry = _Entry(self._load(tenant_id))
+            with self._lock:
+                entry.in_use += 1
+                self._loaded[tenant_id] = entry
+                victims = self._collect_victims()
+        self._close(victims)
+        return entry
+
+    @contextmanager
+    def acquire(self, tenant_id: str):
+        entry = self._checkout(tenant_id)
+        try:
+            yield entry.rag
+        finally:
+            with self._lock:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+            self.evict_idle()
+
+    def _collect_victims(self) -> list:
+        """Pop idle entries over capacity or past the TTL. Caller holds the lock."""
+        now = time.monotonic()
+        victims = []
+        for tenant_id, entry in list(self._loaded.items()):
+            if entry.in_use:
+                continue
+            over_capacity = len(self._loaded) > self.max_loaded
+            expired = now - entry.last_used > self.idle_ttl_s
+            if over_capacity or expired:
+                victims.append((tenant_id, self._loaded.pop(tenant_id)))
+        return victims
+
+    @staticmethod
+    def _close(victims: list):
+        for tenant_id, entry in victims:
+            logger.info(f"Evicting tenant '{tenant_id}'")
+            entry.rag.close()
+
+    def evict_idle(self):
+        with self._lock:
+            victims = self._collect_victims()
+        self._close(victims)
+
+    def cancel_backend(self, tenant_id: str, backend_pid: int, server: str = PRIMARY) -> bool:
+        """
+        pg_cancel_backend on the tenant's `server` ("primary", "replica0", ...).
+        Uses the loaded tenant's pool if there is one; otherwise a single
+        unpooled connection from the config, without loading the tenant.
+        """
+        with self._lock:
+            entry = self._loaded.get(tenant_id)
+        if entry is not None:
+            return entry.rag.cancel_backend(backend_pid, server)
+        cfg = self.tenants[tenant_id]
+        url = cfg.database_url if server == PRIMARY else cfg.replica_urls[int(server[len("replica"):])]
+        engine = create_db_engine(url, poolclass=NullPool)
+        try:
+            with engine.connect() as conn:
+                return bool(conn.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": backend_pid}).scalar())
+        finally:
+            engine.dispose()
+
+    def preload(self, tenant_ids: list):
+        for tenant_id in tenant_ids:
+            with self.acquire(tenant_id):
+                pass
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                tenant_id: {"in_use": e.in_use, "idle_s": round(now - e.last_used, 1),
+                            "replicas": e.rag.router.status()}
+                for tenant_id, e in self._loaded.items()
+            }